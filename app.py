@@ -1,27 +1,88 @@
+import multiprocessing
 import os
 import re
 import shutil
+import time
+import zipfile
 from flask import Flask, render_template, request, redirect, session, make_response, url_for, flash
 import sqlite3
-import pickle
 from io import StringIO
 import csv
 import datetime
-from database import init_db
-from face_recog import capture_face_encoding, run_live_attendance, get_class_encodings, process_frame
+from database import init_db, init_app, get_db, DB_PATH, DEFAULT_POOL_SIZE, DEFAULT_PRAGMAS
+from face_recog import capture_face_encoding, invalidate_class_gallery
+from face_recog import add_to_global_index, remove_from_global_index, reset_global_index, global_index_state
+from face_recog import get_class_detection_settings, invalidate_detection_settings, roster_version, gallery_cache_stats
+from face_recog import rebuild_encoding_store
 import base64
 import numpy as np
 import cv2
 import json
-from utils.hashing import calculate_hash, get_last_hash, recalculate_chain
+from utils.hashing import recalculate_chain
+from utils.encoding_format import pack_encoding
+from utils.face_matching import select_references
+from utils.migrate_encodings import migrate_encodings
+from utils.attendance_writer import write_attendance
+from utils.attendance_aggregator import AttendanceAggregator, find_session, DEFAULT_MIN_HITS, DEFAULT_HIT_WINDOW
 from verify_integrity import verify_chain
+from recognition_session import SessionRegistry, MOTION_GATE_THRESHOLD, MOTION_GATE_REFRESH
+import bulk_enrollment
+import video_attendance
+import group_photo
+from recognition_pool import RecognitionPool, PoolBusy, PoolRestarting, PoolTimeout, recognize_frame, recognize_batch
+from utils.timing import StageTimer, TimingHistograms
+from utils.pacing import pacing_hints
+
+try:
+    from flask_sock import Sock
+except ImportError:  # WebSocket sessions are optional; the page falls back to HTTP polling
+    Sock = None
 
 # Define IST Timezone
 IST = datetime.timezone(datetime.timedelta(hours=5, minutes=30))
 
 app = Flask(__name__)
 app.secret_key = "face_attendance_secret"
+# SQLite connections are pooled and opened with these PRAGMAs (see database.py); every
+# SQLITE_<PRAGMA> environment variable overrides the matching default
+app.config["DB_PATH"] = os.environ.get("DB_PATH", DB_PATH)
+app.config["DB_POOL_SIZE"] = int(os.environ.get("DB_POOL_SIZE", DEFAULT_POOL_SIZE))
+for pragma, default in DEFAULT_PRAGMAS.items():
+    app.config["SQLITE_" + pragma.upper()] = os.environ.get("SQLITE_" + pragma.upper(), default)
+init_app(app)
 init_db()
+# Converts any pickled face encodings left from older versions (no-op once done)
+migrate_encodings(verbose=False)
+# Spawned worker processes re-import this module; only the serving process runs startup tasks
+if multiprocessing.current_process().name == "MainProcess":
+    # Publish the shared encoding store for the workers (rebuilt only if stale)
+    rebuild_encoding_store(only_if_stale=True)
+    # Recordings that were being processed when the server stopped can be resumed
+    video_attendance.mark_orphaned_jobs()
+
+# Recognition runs in a pool of worker processes. RECOGNITION_WORKERS=0 runs it inline.
+app.config["RECOGNITION_WORKERS"] = int(os.environ.get("RECOGNITION_WORKERS", os.cpu_count() or 1))
+app.config["RECOGNITION_MAX_PENDING"] = int(os.environ.get("RECOGNITION_MAX_PENDING", 0)) or None
+app.config["RECOGNITION_TIMEOUT"] = float(os.environ.get("RECOGNITION_TIMEOUT", 5.0))
+# Class photos run their tiles on the same pool, with a longer deadline than single frames
+app.config["GROUP_PHOTO_TIMEOUT"] = float(os.environ.get("GROUP_PHOTO_TIMEOUT", group_photo.DEFAULT_TIMEOUT))
+# Live sessions confirm a student after ATTENDANCE_MIN_HITS matches within ATTENDANCE_HIT_WINDOW seconds
+app.config["ATTENDANCE_MIN_HITS"] = int(os.environ.get("ATTENDANCE_MIN_HITS", DEFAULT_MIN_HITS))
+app.config["ATTENDANCE_HIT_WINDOW"] = float(os.environ.get("ATTENDANCE_HIT_WINDOW", DEFAULT_HIT_WINDOW))
+# Live sessions skip frames that barely changed; MOTION_GATE_THRESHOLD=0 turns this off
+app.config["MOTION_GATE_THRESHOLD"] = float(os.environ.get("MOTION_GATE_THRESHOLD", MOTION_GATE_THRESHOLD))
+app.config["MOTION_GATE_REFRESH"] = float(os.environ.get("MOTION_GATE_REFRESH", MOTION_GATE_REFRESH))
+
+sock = Sock(app) if Sock else None
+recognition_pool = RecognitionPool(app.config["RECOGNITION_WORKERS"],
+                                   max_pending=app.config["RECOGNITION_MAX_PENDING"],
+                                   timeout=app.config["RECOGNITION_TIMEOUT"])
+recognition_sessions = SessionRegistry(recognition_pool,
+                                       min_hits=app.config["ATTENDANCE_MIN_HITS"],
+                                       hit_window=app.config["ATTENDANCE_HIT_WINDOW"],
+                                       motion_threshold=app.config["MOTION_GATE_THRESHOLD"],
+                                       motion_refresh=app.config["MOTION_GATE_REFRESH"])
+recognition_timings = TimingHistograms()
 
 # ---------- LOGIN ----------
 # ── ID validation patterns ─────────────────────────────────────────────────────
@@ -41,7 +102,7 @@ def login():
         role = request.form.get("role")
         username = request.form.get("username")
         password = request.form.get("password")
-        conn = sqlite3.connect('attendance.db')
+        conn = get_db()
         c = conn.cursor()
 
         # --------------------------------------------------------------
@@ -122,7 +183,7 @@ def dashboard():
         return redirect("/teacher_dashboard")
 
     usn = session["username"]
-    conn = sqlite3.connect('attendance.db')
+    conn = get_db()
     c = conn.cursor()
     c.execute("SELECT id, class_id FROM students WHERE usn=?", (usn,))
     student_row = c.fetchone()
@@ -200,19 +261,58 @@ def dashboard():
 # ---------- CLASS MANAGEMENT ----------
 @app.route("/classes")
 def classes():
-    conn = sqlite3.connect('attendance.db')
+    conn = get_db()
     c = conn.cursor()
-    c.execute("SELECT id, class_name FROM classes")
+    c.execute("""SELECT id, class_name, detection_scale, upsample_fallback, min_face_size, min_sharpness, max_yaw
+                 FROM classes""")
     classes = c.fetchall()
     conn.close()
     return render_template("classes.html", classes=classes)
 
+@app.route("/update_class_detection/<int:class_id>", methods=["POST"])
+def update_class_detection(class_id):
+    if session.get("role") != "admin":
+        return "Unauthorized", 403
+
+    try:
+        detection_scale = float(request.form.get("detection_scale", 1.0))
+    except ValueError:
+        detection_scale = 1.0
+    if detection_scale not in (1.0, 0.5, 0.25):
+        flash("Detection scale must be 1, 1/2 or 1/4.", "error")
+        return redirect("/classes")
+    upsample_fallback = 1 if request.form.get("upsample_fallback") else 0
+
+    try:
+        min_face_size = int(request.form.get("min_face_size") or 0)
+        min_sharpness = float(request.form.get("min_sharpness") or 0)
+        max_yaw = float(request.form.get("max_yaw") or 0)
+    except ValueError:
+        flash("Quality limits must be numbers.", "error")
+        return redirect("/classes")
+    if min_face_size < 0 or min_sharpness < 0 or not 0 <= max_yaw <= 90:
+        flash("Quality limits must be positive and the head turn at most 90 degrees.", "error")
+        return redirect("/classes")
+
+    conn = get_db()
+    c = conn.cursor()
+    c.execute("""UPDATE classes SET detection_scale=?, upsample_fallback=?, min_face_size=?, min_sharpness=?, max_yaw=?
+                 WHERE id=?""",
+              (detection_scale, upsample_fallback, min_face_size, min_sharpness, max_yaw, class_id))
+    conn.commit()
+    conn.close()
+    invalidate_detection_settings(class_id)
+    recognition_sessions.reload_class(class_id)
+
+    flash("Detection settings updated!", "success")
+    return redirect("/classes")
+
 @app.route("/add_class", methods=["POST"])
 def add_class():
     # 1. Get and clean the class name
     class_name = request.form["class_name"].strip()
     
-    conn = sqlite3.connect('attendance.db')
+    conn = get_db()
     c = conn.cursor()
     
     # 2. Check if class already exists (Case Insensitive)
@@ -238,7 +338,7 @@ def delete_class(class_id):
     if session.get("role") != "admin":
         return "Unauthorized", 403
     
-    conn = sqlite3.connect('attendance.db')
+    conn = get_db()
     c = conn.cursor()
     
     # Optional: Check if class exists or has dependencies (students, subjects)
@@ -246,7 +346,8 @@ def delete_class(class_id):
     # but SQLite foreign keys need to be enabled for cascade. 
     # Let's do a manual cleanup for safety if foreign keys aren't strict.
     
-    # Delete students
+    # Delete students and their reference encodings
+    c.execute("DELETE FROM student_encodings WHERE student_id IN (SELECT id FROM students WHERE class_id=?)", (class_id,))
     c.execute("DELETE FROM students WHERE class_id=?", (class_id,))
     # Delete subjects
     c.execute("DELETE FROM subjects WHERE class_id=?", (class_id,))
@@ -257,6 +358,9 @@ def delete_class(class_id):
     
     conn.commit()
     conn.close()
+    invalidate_class_gallery(class_id)
+    reset_global_index()
+    recognition_sessions.reload_class(class_id)
     
     flash("Class and associated data deleted successfully!", "success")
     return redirect("/classes")
@@ -266,7 +370,7 @@ def delete_class(class_id):
 def manage_students():
     if session.get("role") != "admin":
         return "Unauthorized", 403
-    conn = sqlite3.connect('attendance.db')
+    conn = get_db()
     c = conn.cursor()
     c.execute("SELECT id, class_name FROM classes ORDER BY class_name")
     classes = c.fetchall()
@@ -288,11 +392,11 @@ def delete_student(student_id):
     if session.get("role") != "admin":
         return "Unauthorized", 403
     
-    conn = sqlite3.connect('attendance.db')
+    conn = get_db()
     c = conn.cursor()
     
     # Get student info to delete face image
-    c.execute("SELECT usn FROM students WHERE id=?", (student_id,))
+    c.execute("SELECT usn, class_id FROM students WHERE id=?", (student_id,))
     student = c.fetchone()
     
     if student:
@@ -308,13 +412,27 @@ def delete_student(student_id):
                     os.remove(path)
                 except:
                     pass
-    
+        # Extra enrollment photos are stored as <USN>_<n><ext>
+        if os.path.isdir('registered_faces'):
+            for filename in os.listdir('registered_faces'):
+                stem, ext = os.path.splitext(filename)
+                if stem.startswith(f"{usn}_") and stem[len(usn) + 1:].isdigit():
+                    try:
+                        os.remove(os.path.join('registered_faces', filename))
+                    except OSError:
+                        pass
+    
+    c.execute("DELETE FROM student_encodings WHERE student_id=?", (student_id,))
     c.execute("DELETE FROM students WHERE id=?", (student_id,))
     # Also delete attendance records?
     c.execute("DELETE FROM attendance WHERE student_id=?", (student_id,))
     
     conn.commit()
     conn.close()
+    if student:
+        invalidate_class_gallery(student[1])
+        remove_from_global_index(student_id)
+        recognition_sessions.reload_class(student[1])
     
     flash("Student deleted successfully!", "success")
     return redirect("/manage_students")
@@ -324,7 +442,7 @@ def delete_assignment(assignment_id):
     if session.get("role") != "admin":
         return "Unauthorized", 403
         
-    conn = sqlite3.connect('attendance.db')
+    conn = get_db()
     c = conn.cursor()
     c.execute("DELETE FROM teacher_assignments WHERE id=?", (assignment_id,))
     conn.commit()
@@ -352,16 +470,28 @@ def add_student():
     if not os.path.exists('registered_faces'):
         os.makedirs('registered_faces')
 
-    image_file = request.files.get("student_image")
+    # Optional per-student match threshold; blank uses the session tolerance
+    threshold_raw = request.form.get("match_threshold", "").strip()
+    try:
+        match_threshold = float(threshold_raw) if threshold_raw else None
+    except ValueError:
+        flash("Match threshold must be a number", "danger")
+        return redirect("/manage_students")
+
+    image_files = [f for f in request.files.getlist("student_image") if f and f.filename]
     image_path_input = request.form.get("image_path")
     
-    dest_path = None
-    
-    if image_file and image_file.filename:
-        # Handle file upload
-        ext = os.path.splitext(image_file.filename)[1]
-        dest_path = os.path.join('registered_faces', f"{usn}{ext}")
-        image_file.save(dest_path)
+    saved_paths = []
+    
+    if image_files:
+        # Handle file upload; several photos (angles, lighting) improve recognition
+        for i, image_file in enumerate(image_files):
+            ext = os.path.splitext(image_file.filename)[1]
+            # The first photo keeps the usual <USN><ext> name, extra ones get a suffix
+            suffix = "" if i == 0 else f"_{i + 1}"
+            dest_path = os.path.join('registered_faces', f"{usn}{suffix}{ext}")
+            image_file.save(dest_path)
+            saved_paths.append(dest_path)
     elif image_path_input:
         # Handle manual path
         image_path = image_path_input.strip('"').strip("'")
@@ -369,6 +499,7 @@ def add_student():
             ext = os.path.splitext(image_path)[1]
             dest_path = os.path.join('registered_faces', f"{usn}{ext}")
             shutil.copyfile(image_path, dest_path)
+            saved_paths.append(dest_path)
         else:
             flash("Source image file not found", "danger")
             return redirect("/manage_students")
@@ -376,26 +507,43 @@ def add_student():
         flash("No image provided", "danger")
         return redirect("/add_student_form")
 
-    if not dest_path:
-        flash("Failed to save image", "danger")
-        return redirect("/add_student_form")
+    encodings = []
+    for dest_path in saved_paths:
+        try:
+            encoding = capture_face_encoding(dest_path)
+        except Exception:
+            encoding = None  # Unreadable image file
+        if encoding is None:
+            # Clean up if no face found
+            if os.path.exists(dest_path):
+                os.remove(dest_path)
+        else:
+            encodings.append(encoding)
 
-    encoding = capture_face_encoding(dest_path)
-    if encoding is None:
-        # Clean up if no face found
-        if os.path.exists(dest_path):
-            os.remove(dest_path)
+    if not encodings:
         flash("Face not found in image. Please use a clear photo.", "danger")
         return redirect("/add_student_form")
-        
-    face_blob = pickle.dumps(encoding)
-    conn = sqlite3.connect('attendance.db')
+
+    # The centroid is matched first; the references only for near-threshold faces
+    references, centroid = select_references(encodings)
+    face_blob = pack_encoding(centroid)
+    conn = get_db()
     c = conn.cursor()
     try:
-        c.execute("INSERT INTO students (usn, name, dob, class_id, face_encoding) VALUES (?,?,?,?,?)",
-                  (usn, name, dob, class_id, face_blob))
+        c.execute("INSERT INTO students (usn, name, dob, class_id, face_encoding, match_threshold) VALUES (?,?,?,?,?,?)",
+                  (usn, name, dob, class_id, face_blob, match_threshold))
+        student_id = c.lastrowid
+        if len(references) > 1:
+            c.executemany("INSERT INTO student_encodings (student_id, face_encoding) VALUES (?,?)",
+                          [(student_id, pack_encoding(reference)) for reference in references])
         conn.commit()
-        flash("Student added successfully!", "success")
+        invalidate_class_gallery(class_id)
+        add_to_global_index(student_id, name, centroid)
+        recognition_sessions.reload_class(class_id)
+        if len(encodings) < len(saved_paths):
+            flash(f"Student added using {len(encodings)} of {len(saved_paths)} photos (no face found in the others).", "warning")
+        else:
+            flash("Student added successfully!", "success")
     except sqlite3.IntegrityError:
         conn.close()
         flash("Student with this USN already exists.", "warning")
@@ -404,6 +552,70 @@ def add_student():
     conn.close()
     return redirect("/add_student_form")
 
+# ---------- BULK ENROLLMENT ----------
+def refresh_class_roster(class_id):
+    """Drops every cached view of a class after a bulk roster change."""
+    invalidate_class_gallery(class_id)
+    reset_global_index()
+    recognition_sessions.reload_class(class_id)
+
+@app.route("/admin/bulk_enroll", methods=["POST"])
+def bulk_enroll():
+    if session.get("role") != "admin":
+        return "Unauthorized", 403
+
+    class_id = request.form.get("class_id")
+    roster_file = request.files.get("roster")
+    archive = request.files.get("archive")
+    folder_path = request.form.get("folder_path", "").strip().strip('"').strip("'")
+
+    if not class_id or not roster_file or not roster_file.filename:
+        flash("Please select a class and a roster CSV.", "danger")
+        return redirect("/manage_students")
+    if not (archive and archive.filename) and not os.path.isdir(folder_path):
+        flash("Please upload a ZIP of photos or enter an existing folder path.", "danger")
+        return redirect("/manage_students")
+
+    roster_csv = roster_file.read().decode("utf-8-sig")
+    try:
+        job_id = bulk_enrollment.create_job(int(class_id), roster_csv,
+                                            archive=archive.stream if archive and archive.filename else None,
+                                            folder=folder_path or None)
+    except zipfile.BadZipFile:
+        flash("The uploaded archive is not a valid ZIP file.", "danger")
+        return redirect("/manage_students")
+
+    bulk_enrollment.start_job(job_id, on_complete=refresh_class_roster)
+    return redirect(f"/admin/bulk_enroll/{job_id}")
+
+@app.route("/admin/bulk_enroll/<int:job_id>")
+def bulk_enroll_progress(job_id):
+    if session.get("role") != "admin":
+        return "Unauthorized", 403
+    job = bulk_enrollment.job_status(job_id)
+    if not job:
+        return "Job not found", 404
+    return render_template("bulk_enrollment.html", job=job)
+
+@app.route("/api/bulk_enroll/<int:job_id>")
+def bulk_enroll_status(job_id):
+    if session.get("role") != "admin":
+        return {"error": "Unauthorized"}, 403
+    job = bulk_enrollment.job_status(job_id)
+    if not job:
+        return {"error": "Job not found"}, 404
+    return job
+
+@app.route("/admin/bulk_enroll/<int:job_id>/resume", methods=["POST"])
+def bulk_enroll_resume(job_id):
+    if session.get("role") != "admin":
+        return "Unauthorized", 403
+    if bulk_enrollment.start_job(job_id, on_complete=refresh_class_roster):
+        flash("Enrollment job resumed.", "success")
+    else:
+        flash("This job is already running.", "warning")
+    return redirect(f"/admin/bulk_enroll/{job_id}")
+
 # ---------- TEACHER MANAGEMENT ----------
 @app.route("/add_teacher", methods=["POST"])
 def add_teacher():
@@ -420,7 +632,7 @@ def add_teacher():
     except:
         dob = dob_raw # Fallback
     
-    conn = sqlite3.connect('attendance.db')
+    conn = get_db()
     c = conn.cursor()
     try:
         c.execute("INSERT INTO teachers (teacher_id, name, dob) VALUES (?,?,?)", (teacher_id, name, dob))
@@ -441,7 +653,7 @@ def assign_teacher():
     class_id = request.form["class_id"]
     subject = request.form["subject"]
     
-    conn = sqlite3.connect('attendance.db')
+    conn = get_db()
     c = conn.cursor()
     
     # Check if assignment already exists
@@ -463,7 +675,7 @@ def manage_teachers():
     if session.get("role") != "admin":
         return "Unauthorized", 403
         
-    conn = sqlite3.connect('attendance.db')
+    conn = get_db()
     c = conn.cursor()
     
     # Get all teachers
@@ -492,7 +704,7 @@ def manage_teachers():
 def subjects():
     if session.get("role") != "admin":
         return "Unauthorized", 403
-    conn = sqlite3.connect('attendance.db')
+    conn = get_db()
     c = conn.cursor()
     c.execute("SELECT id, class_name FROM classes ORDER BY class_name")
     classes = c.fetchall()
@@ -516,7 +728,7 @@ def add_subject():
     class_id = request.form["class_id"]
     name = request.form["name"].strip()  # .strip() removes accidental spaces
     
-    conn = sqlite3.connect('attendance.db')
+    conn = get_db()
     c = conn.cursor()
     
     # 1. Check if subject already exists for this specific class
@@ -544,7 +756,7 @@ def delete_subject(sid):
         return "Unauthorized", 403
     class_id = request.form.get("class_id")
     
-    conn = sqlite3.connect('attendance.db')
+    conn = get_db()
     c = conn.cursor()
     c.execute("DELETE FROM subjects WHERE id=?", (sid,))
     conn.commit()
@@ -561,7 +773,7 @@ def teacher_dashboard():
         return "Unauthorized", 403
         
     teacher_id = session["username"]
-    conn = sqlite3.connect('attendance.db')
+    conn = get_db()
     c = conn.cursor()
     
     # Fetch assignments: (class_id, subject, class_name)
@@ -583,7 +795,7 @@ def mark_attendance():
     if role not in ["admin", "teacher"]:
         return "Unauthorized: Only teachers/admins can mark attendance.", 403
         
-    conn = sqlite3.connect('attendance.db')
+    conn = get_db()
     c = conn.cursor()
     
     # 1. Fetch available classes/subjects based on role
@@ -673,6 +885,200 @@ def mark_attendance():
                            subjects=subjects,
                            selected_subject=selected_subject)
 
+def can_mark_attendance(class_id, subject):
+    """Admins may mark any class; teachers only the class/subject pairs assigned to them."""
+    if session.get("role") == "admin":
+        return True
+    conn = get_db()
+    c = conn.cursor()
+    c.execute("SELECT 1 FROM teacher_assignments WHERE teacher_id=? AND class_id=? AND subject=?",
+              (session.get("username"), int(class_id), subject))
+    assigned = c.fetchone()
+    conn.close()
+    return bool(assigned)
+
+# ---------- RECORDED LECTURES ----------
+@app.route("/video_attendance", methods=["POST"])
+def video_attendance_upload():
+    role = session.get("role")
+    if role not in ["admin", "teacher"]:
+        return "Unauthorized", 403
+
+    class_id = request.form.get("class_id")
+    subject = request.form.get("subject")
+    hour = request.form.get("hour")
+    video = request.files.get("video")
+    back = f"/mark_attendance?class_id={class_id or ''}&subject={subject or ''}"
+
+    if not class_id or not subject or not hour:
+        flash("Please select class, subject and hour.", "danger")
+        return redirect(back)
+    try:
+        class_id = int(class_id)
+    except ValueError:
+        return "Invalid class_id", 400
+    if not video or not video.filename:
+        flash("Please choose a lecture recording to upload.", "danger")
+        return redirect(back)
+    if os.path.splitext(video.filename)[1].lower() not in video_attendance.VIDEO_EXTENSIONS:
+        flash("Unsupported video format.", "danger")
+        return redirect(back)
+
+    if not can_mark_attendance(class_id, subject):
+        return "Unauthorized: You are not assigned to this class and subject.", 403
+
+    try:
+        sample_fps = float(request.form.get("sample_fps") or video_attendance.DEFAULT_SAMPLE_FPS)
+        min_frames = int(request.form.get("min_frames") or video_attendance.DEFAULT_MIN_FRAMES)
+    except ValueError:
+        flash("Sample rate and minimum sightings must be numbers.", "danger")
+        return redirect(back)
+    if sample_fps <= 0 or min_frames < 1:
+        flash("Sample rate and minimum sightings must be positive.", "danger")
+        return redirect(back)
+
+    date = request.form.get("date") or today_ist()
+    try:
+        lecture_date = datetime.date.fromisoformat(date)
+    except ValueError:
+        return "Invalid date, expected YYYY-MM-DD", 400
+    if lecture_date > datetime.datetime.now(IST).date():
+        return "The lecture date cannot be in the future", 400
+    date = lecture_date.strftime("%Y-%m-%d")
+    try:
+        job_id = video_attendance.create_job(class_id, subject, hour, date, video.stream, video.filename,
+                                             sample_fps=sample_fps, min_frames=min_frames)
+    except ValueError as e:
+        flash(str(e), "danger")
+        return redirect(back)
+
+    video_attendance.start_job(job_id)
+    return redirect(f"/video_attendance/{job_id}")
+
+@app.route("/video_attendance/<int:job_id>")
+def video_attendance_progress(job_id):
+    if session.get("role") not in ["admin", "teacher"]:
+        return "Unauthorized", 403
+    job = video_attendance.job_status(job_id)
+    if not job:
+        return "Job not found", 404
+    if not can_mark_attendance(job["class_id"], job["subject"]):
+        return "Unauthorized: You are not assigned to this class and subject.", 403
+    return render_template("video_attendance.html", job=job)
+
+@app.route("/api/video_attendance/<int:job_id>")
+def video_attendance_status(job_id):
+    if session.get("role") not in ["admin", "teacher"]:
+        return {"error": "Unauthorized"}, 403
+    job = video_attendance.job_status(job_id)
+    if not job:
+        return {"error": "Job not found"}, 404
+    if not can_mark_attendance(job["class_id"], job["subject"]):
+        return {"error": "Unauthorized"}, 403
+    return job
+
+@app.route("/video_attendance/<int:job_id>/resume", methods=["POST"])
+def video_attendance_resume(job_id):
+    if session.get("role") not in ["admin", "teacher"]:
+        return "Unauthorized", 403
+    job = video_attendance.job_status(job_id)
+    if not job:
+        return "Job not found", 404
+    if not can_mark_attendance(job["class_id"], job["subject"]):
+        return "Unauthorized: You are not assigned to this class and subject.", 403
+    if video_attendance.resume_job(job_id):
+        flash("Processing resumed.", "success")
+    elif job["running"]:
+        flash("This recording is already being processed.", "warning")
+    else:
+        flash("Only interrupted recordings can be resumed.", "warning")
+    return redirect(f"/video_attendance/{job_id}")
+
+# ---------- GROUP PHOTOS ----------
+def mark_from_group_photo(class_id, subject, hour, buffer, upsample=group_photo.DEFAULT_UPSAMPLE):
+    """
+    Recognizes a class photo and finalizes today's attendance session with it.
+    A face in the photo is enough to confirm a student. If a live session for the
+    same hour is open, the photo adds to its votes. Returns the JSON summary.
+    Raises ValueError for unreadable or oversized images, PoolBusy/PoolTimeout when
+    the recognition pool is overloaded.
+    """
+    image = cv2.imdecode(np.frombuffer(buffer, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("Invalid image data")
+
+    stats = {}
+    results = group_photo.recognize_group_photo(image, class_id, upsample=upsample, stats=stats,
+                                                pool=recognition_pool, timeout=app.config["GROUP_PHOTO_TIMEOUT"])
+
+    date = today_ist()
+    live = recognition_sessions.get(class_id, subject, hour, date)
+    if live:
+        aggregator = live.attendance
+    else:
+        aggregator = AttendanceAggregator(class_id, subject, hour, date,
+                                          app.config["ATTENDANCE_MIN_HITS"], app.config["ATTENDANCE_HIT_WINDOW"])
+    aggregator.record(results, min_hits=1)
+    aggregator.finalize()
+
+    confirmed = aggregator.confirmed_ids()
+    return {
+        "results": results,
+        "present": len(confirmed),
+        "recognized": sum(1 for r in results if r["student_id"] is not None),
+        "faces": stats["faces"],
+        "tiles": stats["tiles"],
+        "duplicates": stats["duplicates"],
+        "timings_ms": {name: round(seconds * 1000, 2) for name, seconds in stats["timings"].items()}
+    }
+
+def read_group_photo_request():
+    """Returns (class_id, subject, hour, buffer, upsample) from a group photo upload, or raises ValueError."""
+    class_id = request.form.get("class_id")
+    subject = request.form.get("subject")
+    hour = request.form.get("hour")
+    photo = request.files.get("photo")
+    if not class_id or not subject or not hour:
+        raise ValueError("Please select class, subject and hour.")
+    if not photo or not photo.filename:
+        raise ValueError("Please choose a class photo to upload.")
+    upsample = 2 if request.form.get("small_faces") else group_photo.DEFAULT_UPSAMPLE
+    return int(class_id), subject, hour, photo.read(), upsample
+
+@app.route("/api/group_photo_attendance", methods=["POST"])
+def api_group_photo_attendance():
+    if session.get("role") not in ["admin", "teacher"]:
+        return {"error": "Unauthorized"}, 403
+    try:
+        class_id, subject, hour, buffer, upsample = read_group_photo_request()
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    if not can_mark_attendance(class_id, subject):
+        return {"error": "Unauthorized"}, 403
+    summary, error = run_recognition(mark_from_group_photo, class_id, subject, hour, buffer, upsample)
+    return error or summary
+
+@app.route("/group_photo_attendance", methods=["POST"])
+def group_photo_attendance():
+    if session.get("role") not in ["admin", "teacher"]:
+        return "Unauthorized", 403
+    back = f"/mark_attendance?class_id={request.form.get('class_id', '')}&subject={request.form.get('subject', '')}"
+    try:
+        class_id, subject, hour, buffer, upsample = read_group_photo_request()
+        if not can_mark_attendance(class_id, subject):
+            return "Unauthorized: You are not assigned to this class and subject.", 403
+        summary = mark_from_group_photo(class_id, subject, hour, buffer, upsample)
+    except ValueError as e:
+        flash(str(e), "danger")
+        return redirect(back)
+    except (PoolBusy, PoolTimeout):
+        flash("Recognition is busy right now, please try the photo again shortly.", "danger")
+        return redirect(back)
+
+    flash(f"Found {summary['faces']} faces, recognized {summary['recognized']}. "
+          f"{summary['present']} students marked present for hour {hour}.", "success")
+    return redirect(back)
+
 # ---------- ADMIN ATTENDANCE ----------
 @app.route("/admin/attendance", methods=["GET", "POST"])
 def admin_attendance():
@@ -680,7 +1086,7 @@ def admin_attendance():
     if role not in ["admin", "teacher"]:
         return "Unauthorized", 403
 
-    conn = sqlite3.connect('attendance.db')
+    conn = get_db()
     c = conn.cursor()
 
     # ------------------- POST (Update/Request Changes) -------------------
@@ -903,7 +1309,7 @@ def delete_attendance(att_id):
     student_id = request.form.get("student_id") or ""
 
     # 2. Perform Deletion
-    conn = sqlite3.connect('attendance.db')
+    conn = get_db()
     c = conn.cursor()
     c.execute("DELETE FROM attendance WHERE id=?", (att_id,))
     conn.commit()
@@ -924,7 +1330,7 @@ def student_attendance_history():
     if role not in ["admin", "teacher"]:
         return "Unauthorized", 403
         
-    conn = sqlite3.connect('attendance.db')
+    conn = get_db()
     c = conn.cursor()
     
     # Fetch classes
@@ -1080,7 +1486,7 @@ def download_attendance():
     subject = request.args.get("subject")
     date = request.args.get("date")
     student_id = request.args.get("student_id")
-    conn = sqlite3.connect('attendance.db')
+    conn = get_db()
     c = conn.cursor()
     query = """SELECT students.usn, students.name, attendance.subject, attendance.date, attendance.status
                FROM attendance
@@ -1120,7 +1526,7 @@ def download_student_history():
     end_date = request.args.get("end_date")
     subject = request.args.get("subject")
     
-    conn = sqlite3.connect('attendance.db')
+    conn = get_db()
     c = conn.cursor()
     
     # Get student info
@@ -1173,7 +1579,7 @@ def download_class_history():
     end_date = request.args.get("end_date")
     subject = request.args.get("subject")
     
-    conn = sqlite3.connect('attendance.db')
+    conn = get_db()
     c = conn.cursor()
     
     query = """SELECT students.usn, students.name, attendance.subject, attendance.date, attendance.status, attendance.hour
@@ -1219,7 +1625,7 @@ def attendance_graph(subject):
     if "username" not in session or session["role"] != "student":
         return redirect("/")
     usn = session["username"]
-    conn = sqlite3.connect('attendance.db')
+    conn = get_db()
     c = conn.cursor()
     c.execute("SELECT id FROM students WHERE usn=?", (usn,))
     student_id = c.fetchone()[0]
@@ -1265,45 +1671,225 @@ def logout():
 
 # ---------- API FOR BROWSER-BASED RECOGNITION ----------
 
+def read_frame_request():
+    """
+    Reads a frame and its parameters from a recognition request. Three encodings are accepted:
+      - raw JPEG bytes (image/jpeg or application/octet-stream), parameters in the
+        query string or X-Class-Id / X-Mode headers
+      - multipart/form-data with the JPEG in a "frame" file field
+      - the original JSON body with a base64 data URL in "image"
+    Returns (buffer, params). The JPEG bytes are decoded by the recognition worker.
+    """
+    content_type = request.mimetype or ""
+
+    if content_type == "application/json":
+        params = request.get_json(silent=True) or {}
+        image_data = params.get("image")
+        if not image_data:
+            return b"", params
+        # Decode base64 image
+        try:
+            header, encoded = image_data.split(",", 1)
+            buffer = base64.b64decode(encoded)
+        except Exception:
+            return b"", params
+    else:
+        params = dict(request.args)
+        for key in ("class_id", "mode", "n_probe", "subject", "hour"):
+            header_value = request.headers.get("X-" + key.replace("_", "-").title())
+            if header_value and key not in params:
+                params[key] = header_value
+
+        if content_type == "multipart/form-data":
+            params.update(request.form.to_dict())
+            upload = request.files.get("frame")
+            buffer = upload.read() if upload else b""
+        else:
+            # Raw body: read straight from the request stream, no intermediate copies
+            buffer = request.stream.read()
+
+    return buffer, params
+
+def current_pacing():
+    """Frame pacing hints for live clients from the current recognition load."""
+    return pacing_hints(*recognition_pool.load())
+
+def run_recognition(task, *args):
+    """Runs a task on the recognition pool and maps pool errors to HTTP responses."""
+    try:
+        return task(*args), None
+    except PoolRestarting:
+        return None, ({"error": "Recognition workers restarting, retry shortly", "pacing": current_pacing()}, 503)
+    except PoolBusy:
+        return None, ({"error": "Recognition queue full, retry shortly", "pacing": current_pacing()}, 503)
+    except PoolTimeout:
+        return None, ({"error": "Recognition timed out"}, 504)
+    except ValueError as e:
+        return None, ({"error": str(e)}, 400)
+
 @app.route("/api/recognize", methods=["POST"])
 def api_recognize():
-    data = request.get_json()
-    image_data = data.get("image")
+    started = time.perf_counter()
+    timer = StageTimer()
+    with timer.stage("read"):
+        buffer, data = read_frame_request()
     class_id = data.get("class_id")
+    # "global" searches every enrolled student (exams, labs, combined lectures)
+    mode = data.get("mode", "class")
 
-    if not image_data or not class_id:
+    if not class_id and mode != "global":
         return {"error": "Missing data"}, 400
 
-    # Decode base64 image
     try:
-        header, encoded = image_data.split(",", 1)
-        data = base64.b64decode(encoded)
-        np_arr = np.frombuffer(data, np.uint8)
-        frame = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
-    except Exception as e:
-        return {"error": "Invalid image data"}, 400
-
-    # Get encodings (In production, cache this!)
-    known_encodings, student_ids, student_names = get_class_encodings(class_id)
+        class_id = int(class_id) if class_id else None
+        n_probe = int(data["n_probe"]) if data.get("n_probe") else None
+    except (TypeError, ValueError):
+        return {"error": "Invalid class_id or n_probe"}, 400
 
-    # Process frame
-    results = process_frame(frame, known_encodings, student_ids, student_names)
+    if not buffer:
+        return {"error": "Invalid image data"}, 400
 
-    return {"results": results}
+    # Requests that name a subject/hour belong to a live session and share its state
+    if mode != "global" and data.get("subject") and data.get("hour"):
+        # motion_gate=0 processes every frame of a new session (e.g. to measure what the gate saves)
+        recognition_session = recognition_sessions.open(class_id, data["subject"], data["hour"], today_ist(),
+                                                        motion_gate=str(data.get("motion_gate", 1)).lower() not in ("0", "false"))
+        results, error = run_recognition(recognition_session.process, buffer, timer)
+    else:
+        if mode == "global":
+            # Enrollments since the worker built its index travel with the task
+            options = {"mode": "global", "n_probe": n_probe, "global_index": global_index_state()}
+        else:
+            options = {"detection": get_class_detection_settings(class_id)}
+        # The worker loads the gallery from its own per-class cache
+        pool_started = time.perf_counter()
+        output, error = run_recognition(recognition_pool.run, recognize_frame, buffer,
+                                        class_id, roster_version(), options)
+        results = output[0] if output else None
+        if output:
+            frame_stats = output[2]
+            timer.update(frame_stats["timings"])
+            timer.add("queue", time.perf_counter() - pool_started - frame_stats["worker_seconds"])
+
+    if error:
+        return error
+    timer.add("total", time.perf_counter() - started)
+    recognition_timings.record(class_id if mode != "global" else "global", timer.stages)
+    # Live clients follow these hints instead of a fixed frame interval
+    return {"results": results, "pacing": current_pacing()}, 200, {"Server-Timing": timer.server_timing()}
+
+# Upper bound on frames per batch request so one burst cannot monopolise a worker
+MAX_BATCH_FRAMES = 32
+
+@app.route("/api/recognize_batch", methods=["POST"])
+def api_recognize_batch():
+    """
+    Recognizes a burst of frames (e.g. sampled from a short clip) for one class.
+    Accepts multipart/form-data with repeated "frames" file fields, or JSON with
+    "images" as a list of base64 data URLs. Returns per-frame results plus the
+    students present in at least min_frames frames.
+    """
+    if request.mimetype == "application/json":
+        data = request.get_json(silent=True) or {}
+        buffers = []
+        for image_data in data.get("images", []):
+            try:
+                header, encoded = image_data.split(",", 1)
+                buffers.append(base64.b64decode(encoded))
+            except Exception:
+                return {"error": "Invalid image data"}, 400
+    else:
+        data = request.form.to_dict()
+        data.update(request.args.to_dict())
+        buffers = [f.read() for f in request.files.getlist("frames")]
 
-# Check and migrate DB if needed
-def check_db_migration():
-    conn = sqlite3.connect('attendance.db')
-    c = conn.cursor()
     try:
-        c.execute("SELECT hour FROM attendance LIMIT 1")
-    except sqlite3.OperationalError:
-        print("Migrating database: Adding 'hour' column to attendance table...")
-        c.execute("ALTER TABLE attendance ADD COLUMN hour INTEGER DEFAULT 1")
-        conn.commit()
-    conn.close()
+        class_id = int(data.get("class_id"))
+        min_frames = int(data.get("min_frames", 1))
+    except (TypeError, ValueError):
+        return {"error": "Invalid class_id or min_frames"}, 400
+
+    if not buffers or not all(buffers):
+        return {"error": "No frames provided"}, 400
+    if len(buffers) > MAX_BATCH_FRAMES:
+        return {"error": f"At most {MAX_BATCH_FRAMES} frames per batch"}, 400
+
+    options = {"detection": get_class_detection_settings(class_id), "min_frames": min_frames}
+    # A batch is allowed proportionally more time than a single frame
+    output, error = run_recognition(lambda: recognition_pool.run(
+        recognize_batch, buffers, class_id, roster_version(), options,
+        timeout=recognition_pool.timeout * len(buffers)))
+    if error:
+        return error
+
+    frame_results, presence, stats = output
+    return {"frames": frame_results, "present": presence}
+
+def today_ist():
+    return datetime.datetime.now(IST).date().strftime("%Y-%m-%d")
+
+def ws_recognize(ws):
+    """
+    Streaming recognition channel for one (class_id, subject, hour) session.
+    The client sends binary JPEG frames and gets a JSON message back for each one,
+    so it can send the next frame as soon as the server is ready for it.
+    """
+    if session.get("role") not in ["admin", "teacher"]:
+        ws.send(json.dumps({"type": "error", "error": "Unauthorized"}))
+        return
 
-check_db_migration()
+    class_id = request.args.get("class_id")
+    subject = request.args.get("subject")
+    hour = request.args.get("hour")
+    try:
+        recognition_session = recognition_sessions.open(class_id, subject, hour, today_ist(),
+                                                        motion_gate=request.args.get("motion_gate") != "0")
+    except (TypeError, ValueError):
+        ws.send(json.dumps({"type": "error", "error": "Invalid class_id"}))
+        return
+
+    ws.send(json.dumps({"type": "ready", "students": recognition_session.stats()["students"]}))
+
+    while True:
+        message = ws.receive()
+        if message is None:
+            break
+        if isinstance(message, str):
+            # Text messages are control messages
+            try:
+                control = json.loads(message).get("type")
+            except (ValueError, AttributeError):
+                ws.send(json.dumps({"type": "error", "error": "Invalid control message"}))
+                continue
+            if control == "stop":
+                break
+            continue
+
+        started = time.perf_counter()
+        timer = StageTimer()
+        results, error = run_recognition(recognition_session.process, message, timer)
+        if error:
+            ws.send(json.dumps({"type": "error", "error": error[0]["error"], "pacing": current_pacing()}))
+            continue
+        timer.add("total", time.perf_counter() - started)
+        recognition_timings.record(recognition_session.class_id, timer.stages)
+        ws.send(json.dumps({"type": "results", "frame": recognition_session.frames, "results": results,
+                            "pacing": current_pacing()}))
+
+if sock:
+    sock.route("/ws/recognize")(ws_recognize)
+
+@app.route("/admin/recognition_stats")
+def recognition_stats():
+    if session.get("role") != "admin":
+        return "Unauthorized", 403
+    return {
+        "pool": recognition_pool.stats(),
+        "gallery_cache": gallery_cache_stats(),
+        "sessions": [s.stats() for s in recognition_sessions.sessions()],
+        # Rolling per-class stage latencies in milliseconds
+        "timings": recognition_timings.stats()
+    }
 
 @app.route("/api/submit_attendance", methods=["POST"])
 def api_submit_attendance():
@@ -1316,44 +1902,27 @@ def api_submit_attendance():
     if not class_id or not subject or not hour:
         return {"error": "Missing class_id, subject, or hour"}, 400
 
-    conn = sqlite3.connect('attendance.db')
-    c = conn.cursor()
-    
-    # Get all students in class to mark absent ones
-    c.execute("SELECT id FROM students WHERE class_id=?", (class_id,))
-    all_students = [row[0] for row in c.fetchall()]
-    
     date_today = datetime.datetime.now(IST).date().strftime("%Y-%m-%d")
-    
-    # Get the last hash to start the chain for this batch
-    previous_hash = get_last_hash(c)
-    
-    for sid in all_students:
-        status = "Present" if sid in present_student_ids else "Absent"
-        # Check if already marked for today/subject/hour to avoid duplicates
-        c.execute("SELECT id FROM attendance WHERE student_id=? AND subject=? AND date=? AND hour=?", (sid, subject, date_today, hour))
-        existing = c.fetchone()
-        
-        if existing:
-             # If updating, we update the status. 
-             # NOTE: This will technically break the hash chain verification for this record 
-             # and potentially subsequent ones, which is the intended behavior for tamper detection.
-             # We do NOT update the hash here to preserve the original chain history as much as possible,
-             # or we could update it and break the next link. 
-             # For now, we just update status.
-             c.execute("UPDATE attendance SET status=? WHERE id=?", (status, existing[0]))
-        else:
-            # Calculate hash for the new record
-            current_hash = calculate_hash(sid, subject, date_today, status, hour, previous_hash)
-            
-            c.execute("INSERT INTO attendance (student_id, subject, date, status, hour, previous_hash, current_hash) VALUES (?,?,?,?,?,?,?)",
-                      (sid, subject, date_today, status, hour, previous_hash, current_hash))
-            
-            # Update previous_hash for the next iteration
-            previous_hash = current_hash
 
-    conn.commit()
-    conn.close()
+    # Live sessions decided presence on the server while frames came in; submitting finalizes them.
+    # The list sent by the browser is only used when no server-side session exists.
+    recognition_session = recognition_sessions.close(class_id, subject, hour, date_today)
+    if recognition_session:
+        aggregator = recognition_session.attendance
+    elif find_session(class_id, subject, hour, date_today):
+        aggregator = AttendanceAggregator(class_id, subject, hour, date_today,
+                                          app.config["ATTENDANCE_MIN_HITS"], app.config["ATTENDANCE_HIT_WINDOW"])
+    else:
+        aggregator = None
+
+    if aggregator:
+        aggregator.finalize()
+    else:
+        conn = get_db()
+        c = conn.cursor()
+        write_attendance(c, class_id, subject, date_today, hour, present_student_ids)
+        conn.commit()
+        conn.close()
 
     return {"status": "success", "message": "Attendance marked successfully"}
 
@@ -1367,7 +1936,7 @@ def verify_integrity_route():
 
 @app.route("/api/get_subjects/<int:class_id>")
 def get_subjects_api(class_id):
-    conn = sqlite3.connect('attendance.db')
+    conn = get_db()
     c = conn.cursor()
     c.execute("SELECT name FROM subjects WHERE class_id=? ORDER BY name", (class_id,))
     subjects = [row[0] for row in c.fetchall()]
@@ -1380,7 +1949,7 @@ def admin_approvals():
     if session.get("role") != "admin":
         return "Unauthorized", 403
         
-    conn = sqlite3.connect('attendance.db')
+    conn = get_db()
     c = conn.cursor()
     
     # Fetch pending changes with details
@@ -1461,7 +2030,7 @@ def student_request_change():
             file.save(filepath)
             document_path = f"uploads/documents/{filename}" # Relative path for serving
             
-    conn = sqlite3.connect('attendance.db')
+    conn = get_db()
     c = conn.cursor()
     
     # Check if there's already a pending request for this attendance record
@@ -1493,7 +2062,7 @@ def approve_change(change_id):
     if session.get("role") != "admin":
         return "Unauthorized", 403
         
-    conn = sqlite3.connect('attendance.db')
+    conn = get_db()
     c = conn.cursor()
     
     # 1. Get change details
@@ -1526,7 +2095,7 @@ def reject_change(change_id):
     if session.get("role") != "admin":
         return "Unauthorized", 403
         
-    conn = sqlite3.connect('attendance.db')
+    conn = get_db()
     c = conn.cursor()
     c.execute("DELETE FROM pending_attendance_changes WHERE id=?", (change_id,))
     conn.commit()
@@ -1545,7 +2114,7 @@ def approve_batch():
         flash("No changes selected", "error")
         return redirect("/admin/approvals")
     
-    conn = sqlite3.connect('attendance.db')
+    conn = get_db()
     conn.execute("BEGIN IMMEDIATE")  # Exclusive lock for transaction safety
     c = conn.cursor()
     
@@ -1596,7 +2165,7 @@ def reject_batch():
         flash("No changes selected", "error")
         return redirect("/admin/approvals")
     
-    conn = sqlite3.connect('attendance.db')
+    conn = get_db()
     c = conn.cursor()
     
     try:
@@ -0,0 +1,261 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import cv2
+import numpy as np
+import face_recognition
+import face_recog
+from database import close_idle_connections, get_connection, init_db
+from utils.encoding_format import pack_encoding
+from utils.face_matching import DEFAULT_TOLERANCE, match_faces
+
+try:
+    import resource
+except ImportError:  # Windows: peak RSS is not reported
+    resource = None
+
+IMAGE_DIRS = ["known_images", "registered_faces"]
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+DEFAULT_GALLERY_SIZES = [100, 1000, 10000, 50000]
+BENCH_CLASS_ID = 1
+
+
+def percentiles(samples):
+    """Latency summary in milliseconds."""
+    if not samples:
+        return None
+    ms = np.asarray(samples) * 1000
+    return {
+        "count": len(samples),
+        "mean": round(float(ms.mean()), 3),
+        "p50": round(float(np.percentile(ms, 50)), 3),
+        "p90": round(float(np.percentile(ms, 90)), 3),
+        "p99": round(float(np.percentile(ms, 99)), 3),
+        "max": round(float(ms.max()), 3)
+    }
+
+
+def timed(fn, *args, **kwargs):
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def traced_peak(fn, *args):
+    """Peak Python/NumPy heap allocated by one call, in bytes."""
+    tracemalloc.start()
+    try:
+        fn(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def load_frames(image_dirs, quality):
+    """Re-encodes every image as a JPEG, which is what the browser sends per frame."""
+    frames = []
+    paths = []
+    for image_dir in image_dirs:
+        if not os.path.isdir(image_dir):
+            continue
+        for filename in sorted(os.listdir(image_dir)):
+            if os.path.splitext(filename)[1].lower() not in IMAGE_EXTENSIONS:
+                continue
+            path = os.path.abspath(os.path.join(image_dir, filename))
+            image = cv2.imread(path)
+            if image is None:
+                continue
+            ok, buffer = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            if ok:
+                frames.append(buffer.tobytes())
+                paths.append(path)
+    return frames, paths
+
+
+def synthetic_gallery(size, planted, rng):
+    """
+    Random 128-d encodings with the real encodings of the replayed faces planted
+    at random rows, so matching has something to find.
+    """
+    gallery = rng.normal(0.0, 0.09, (size, 128))
+    planted = planted[:size]
+    rows = rng.choice(size, len(planted), replace=False) if len(planted) else []
+    for row, encoding in zip(rows, planted):
+        gallery[row] = encoding
+    return gallery
+
+
+def bench_enrollment(paths):
+    """Times capture_face_encoding on the enrollment photos."""
+    samples = []
+    for path in paths:
+        _, elapsed = timed(face_recog.capture_face_encoding, path)
+        samples.append(elapsed)
+    return percentiles(samples)
+
+
+def bench_stages(frames, repeat, detection):
+    """
+    Runs decode / detect / encode on every frame `repeat` times.
+    Returns the stage timings and the encodings found (used for matching).
+    """
+    stages = {"decode": [], "detect": [], "encode": []}
+    encodings = []
+    for i in range(repeat):
+        for buffer in frames:
+            frame, elapsed = timed(cv2.imdecode, np.frombuffer(buffer, np.uint8), cv2.IMREAD_COLOR)
+            stages["decode"].append(elapsed)
+            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+            locations, elapsed = timed(face_recog.detect_faces, rgb_frame, detection)
+            stages["detect"].append(elapsed)
+
+            found, elapsed = timed(face_recognition.face_encodings, rgb_frame, known_face_locations=locations)
+            stages["encode"].append(elapsed)
+            if i == 0:
+                encodings.append(found)
+    return {name: percentiles(samples) for name, samples in stages.items()}, encodings
+
+
+def bench_gallery(size, frames, frame_encodings, repeat, tolerance, detection, rng):
+    """Match, gallery load and end-to-end process_frame timings for one gallery size."""
+    planted = np.asarray([enc for found in frame_encodings for enc in found]).reshape(-1, 128)
+    gallery = synthetic_gallery(size, planted, rng)
+
+    # get_class_encodings reads from attendance.db in the working directory (a scratch copy)
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("DELETE FROM students")
+    c.executemany("INSERT INTO students (usn, name, dob, class_id, face_encoding) VALUES (?,?,?,?,?)",
+                  [(f"BENCH{i:06d}", f"Student {i}", "01012000", BENCH_CLASS_ID, pack_encoding(enc))
+                   for i, enc in enumerate(gallery)])
+    conn.commit()
+    conn.close()
+
+    load_samples = []
+    for _ in range(repeat):
+        (known, student_ids, student_names), elapsed = timed(face_recog.get_class_encodings, BENCH_CLASS_ID)
+        load_samples.append(elapsed)
+    # Memory is measured on a separate pass because tracing slows allocations down
+    load_peak = traced_peak(face_recog.get_class_encodings, BENCH_CLASS_ID)
+
+    match_samples = []
+    matched = 0
+    for _ in range(repeat):
+        for found in frame_encodings:
+            (indices, _), elapsed = timed(match_faces, found, known, tolerance)
+            match_samples.append(elapsed)
+            matched += int(np.count_nonzero(indices >= 0))
+    match_peak = max([traced_peak(match_faces, found, known, tolerance) for found in frame_encodings] or [0])
+
+    frame_samples = []
+    for _ in range(repeat):
+        for buffer in frames:
+            started = time.perf_counter()
+            frame = cv2.imdecode(np.frombuffer(buffer, np.uint8), cv2.IMREAD_COLOR)
+            face_recog.process_frame(frame, known, student_ids, student_names, tolerance, detection=detection)
+            frame_samples.append(time.perf_counter() - started)
+
+    mean_frame = float(np.mean(frame_samples)) if frame_samples else None
+    return {
+        "gallery_size": size,
+        "load": percentiles(load_samples),
+        "match": percentiles(match_samples),
+        "process_frame": percentiles(frame_samples),
+        # process_frame is single-threaded, so one frame at a time is one core's worth
+        "frames_per_second_per_core": round(1.0 / mean_frame, 2) if mean_frame else None,
+        "faces_matched": matched,
+        "load_peak_mb": round(load_peak / 1e6, 2),
+        "match_peak_mb": round(match_peak / 1e6, 2)
+    }
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return round(peak / 1e6 if sys.platform == "darwin" else peak / 1e3, 2)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the face recognition pipeline.")
+    parser.add_argument("--gallery-sizes", default=",".join(str(s) for s in DEFAULT_GALLERY_SIZES),
+                        help="comma separated synthetic gallery sizes (default: %(default)s)")
+    parser.add_argument("--images", nargs="+", default=IMAGE_DIRS,
+                        help="directories with frames to replay (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=3, help="passes over the frame set per measurement")
+    parser.add_argument("--scale", type=float, default=1.0, help="detection scale (1.0, 0.5, 0.25)")
+    parser.add_argument("--quality", type=int, default=90, help="JPEG quality of the replayed frames")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON report path")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.gallery_sizes.split(",") if s.strip()]
+    output = os.path.abspath(args.output)
+    frames, paths = load_frames(args.images, args.quality)
+    if not frames:
+        parser.error("no images found in " + ", ".join(args.images))
+
+    detection = face_recog.DetectionSettings(scale=args.scale)
+    rng = np.random.default_rng(args.seed)
+    print(f"Replaying {len(frames)} frames x {args.repeat}, gallery sizes {sizes}")
+
+    enrollment = bench_enrollment(paths)
+    stages, frame_encodings = bench_stages(frames, args.repeat, detection)
+
+    galleries = []
+    # The benchmark writes synthetic students, so it works on a scratch database
+    with tempfile.TemporaryDirectory() as scratch:
+        cwd = os.getcwd()
+        os.chdir(scratch)
+        try:
+            init_db()
+            for size in sizes:
+                result = bench_gallery(size, frames, frame_encodings, args.repeat, args.tolerance, detection, rng)
+                print(f"  {size:>6} students: match p50 {result['match']['p50'] if result['match'] else '-'} ms, "
+                      f"{result['frames_per_second_per_core']} frames/s per core")
+                galleries.append(result)
+        finally:
+            # Pooled connections would keep the scratch database open
+            close_idle_connections()
+            os.chdir(cwd)
+
+    report = {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "frames": len(frames),
+        "repeat": args.repeat,
+        "detection_scale": args.scale,
+        "enrollment_encode": enrollment,
+        "stages": stages,
+        "galleries": galleries,
+        "peak_rss_mb": peak_rss_mb()
+    }
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+import csv
+import datetime
+import multiprocessing
+import os
+import shutil
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from io import StringIO
+from face_recog import encode_enrollment_image
+from utils.encoding_format import pack_encoding
+from database import get_connection
+
+UPLOAD_DIR = "bulk_uploads"
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+# Rows written per transaction; also the unit of progress/resume
+BATCH_SIZE = 64
+ENROLLMENT_WORKERS = int(os.environ.get("ENROLLMENT_WORKERS", os.cpu_count() or 1))
+
+_active_jobs = set()
+_active_lock = threading.Lock()
+
+
+def normalize_dob(dob_raw):
+    """Same conversion as the single-student form: yyyy-mm-dd -> ddmmyyyy."""
+    try:
+        parts = dob_raw.split("-")
+        return f"{parts[2]}{parts[1]}{parts[0]}"
+    except IndexError:
+        return dob_raw
+
+
+def parse_roster(csv_text):
+    """
+    Reads a roster CSV with usn, name, dob columns. USNs keep their case (login compares
+    them exactly) but are matched case-insensitively. Returns ({USN.upper(): (usn, name, dob)},
+    [(usn, name, dob) of rows repeating an earlier USN]).
+    """
+    roster = {}
+    duplicates = []
+    for row in csv.DictReader(StringIO(csv_text)):
+        row = {(k or "").strip().lower(): (v or "").strip() for k, v in row.items()}
+        if not row.get("usn"):
+            continue
+        entry = (row["usn"], row.get("name", ""), normalize_dob(row.get("dob", "")))
+        if row["usn"].upper() in roster:
+            duplicates.append(entry)
+        else:
+            roster[row["usn"].upper()] = entry
+    return roster, duplicates
+
+
+def create_job(class_id, roster_csv, archive=None, folder=None):
+    """
+    Registers a bulk enrollment job from a ZIP archive (file object) or a server-side
+    folder of <USN>.<ext> images plus a roster CSV. Images are staged under
+    bulk_uploads/<job_id>/ and one item row is written per roster entry / image.
+    Raises zipfile.BadZipFile if the archive cannot be read. Returns the job id.
+    """
+    roster, duplicate_rows = parse_roster(roster_csv)
+    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("INSERT INTO enrollment_jobs (class_id, status, created_at) VALUES (?, 'pending', ?)",
+              (class_id, timestamp))
+    job_id = c.lastrowid
+    job_dir = os.path.join(UPLOAD_DIR, str(job_id))
+    os.makedirs(job_dir, exist_ok=True)
+
+    # 1. Stage the images, keyed by the USN taken from the file name; the first image of a USN wins
+    images = {}
+    duplicate_images = []
+    if archive is not None:
+        try:
+            with zipfile.ZipFile(archive) as zf:
+                for member in zf.infolist():
+                    # Only use the base name so archive paths cannot escape the job directory
+                    filename = os.path.basename(member.filename)
+                    usn, ext = os.path.splitext(filename)
+                    if member.is_dir() or ext.lower() not in IMAGE_EXTENSIONS:
+                        continue
+                    # Not extracted: a second file of the same name would overwrite the first
+                    if usn.upper() in images:
+                        duplicate_images.append((usn, None))
+                        continue
+                    dest = os.path.join(job_dir, filename)
+                    with zf.open(member) as src, open(dest, "wb") as dst:
+                        shutil.copyfileobj(src, dst)
+                    images[usn.upper()] = dest
+        except zipfile.BadZipFile:
+            conn.rollback()
+            conn.close()
+            shutil.rmtree(job_dir, ignore_errors=True)
+            raise
+    elif folder:
+        for filename in sorted(os.listdir(folder)):
+            usn, ext = os.path.splitext(filename)
+            if ext.lower() not in IMAGE_EXTENSIONS:
+                continue
+            if usn.upper() in images:
+                duplicate_images.append((usn, os.path.join(folder, filename)))
+            else:
+                images[usn.upper()] = os.path.join(folder, filename)
+
+    # 2. One item per roster row; images without a roster row and duplicates are reported too
+    items = []
+    for key, (usn, name, dob) in roster.items():
+        if key in images:
+            items.append((job_id, usn, name, dob, images[key], "pending", None))
+        else:
+            items.append((job_id, usn, name, dob, None, "failed", "No image found for this USN"))
+    for usn, name, dob in duplicate_rows:
+        items.append((job_id, usn, name, dob, None, "failed", "Duplicate USN in roster; the first row was used"))
+    for key, path in images.items():
+        if key not in roster:
+            usn = os.path.splitext(os.path.basename(path))[0]
+            items.append((job_id, usn, None, None, path, "failed", "USN not in roster"))
+    for usn, path in duplicate_images:
+        items.append((job_id, usn, None, None, path, "failed", "Duplicate image for this USN; the first one was used"))
+
+    c.executemany("""INSERT INTO enrollment_items (job_id, usn, name, dob, image_path, status, message)
+                     VALUES (?,?,?,?,?,?,?)""", items)
+    already_failed = sum(1 for item in items if item[5] == "failed")
+    c.execute("UPDATE enrollment_jobs SET total=?, processed=? WHERE id=?", (len(items), already_failed, job_id))
+    conn.commit()
+    conn.close()
+    return job_id
+
+
+def start_job(job_id, on_complete=None):
+    """
+    Runs (or resumes) a job in a background thread. Only items still pending are
+    processed, so a job interrupted by a restart simply continues where it stopped.
+    Returns False if the job is already running in this process.
+    """
+    with _active_lock:
+        if job_id in _active_jobs:
+            return False
+        _active_jobs.add(job_id)
+    threading.Thread(target=_run_job, args=(job_id, on_complete), daemon=True).start()
+    return True
+
+
+def _run_job(job_id, on_complete):
+    conn = get_connection()
+    c = conn.cursor()
+    class_id = None
+    try:
+        c.execute("SELECT class_id FROM enrollment_jobs WHERE id=?", (job_id,))
+        class_id = c.fetchone()[0]
+        c.execute("UPDATE enrollment_jobs SET status='running' WHERE id=?", (job_id,))
+        conn.commit()
+
+        c.execute("""SELECT id, usn, name, dob, image_path FROM enrollment_items
+                     WHERE job_id=? AND status='pending' ORDER BY id""", (job_id,))
+        pending = c.fetchall()
+        os.makedirs('registered_faces', exist_ok=True)
+
+        with ProcessPoolExecutor(max_workers=max(1, ENROLLMENT_WORKERS),
+                                 mp_context=multiprocessing.get_context("spawn")) as executor:
+            for start in range(0, len(pending), BATCH_SIZE):
+                batch = pending[start:start + BATCH_SIZE]
+                existing = _existing_usns(c, [item[1] for item in batch])
+                # Duplicates are reported without spending encoder time on them
+                to_encode = [item for item in batch if item[1].upper() not in existing]
+                encoded = dict(zip([item[0] for item in to_encode],
+                                   executor.map(encode_enrollment_image, [item[4] for item in to_encode])))
+                _write_batch(c, job_id, class_id, batch, existing, encoded)
+                conn.commit()
+
+        c.execute("UPDATE enrollment_jobs SET status='completed' WHERE id=?", (job_id,))
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        c.execute("UPDATE enrollment_jobs SET status='interrupted', message=? WHERE id=?", (str(e), job_id))
+        conn.commit()
+    finally:
+        conn.close()
+        with _active_lock:
+            _active_jobs.discard(job_id)
+        if on_complete and class_id is not None:
+            on_complete(class_id)
+
+
+def _existing_usns(c, usns):
+    """Upper-cased USNs of the batch that already belong to a student, in any case."""
+    placeholders = ",".join("?" * len(usns))
+    c.execute(f"SELECT UPPER(usn) FROM students WHERE UPPER(usn) IN ({placeholders})", [usn.upper() for usn in usns])
+    return {row[0] for row in c.fetchall()}
+
+
+def _write_batch(c, job_id, class_id, batch, existing, encoded):
+    """Inserts one batch of students and records the outcome of every item, in one transaction."""
+    students = []
+    outcomes = []
+    for item_id, usn, name, dob, image_path in batch:
+        if usn.upper() in existing:
+            outcomes.append(("failed", "Duplicate USN: student already exists", item_id))
+            continue
+
+        encoding, error = encoded[item_id]
+        if encoding is None:
+            outcomes.append(("failed", error, item_id))
+        else:
+            ext = os.path.splitext(image_path)[1]
+            dest_path = os.path.join('registered_faces', f"{usn}{ext}")
+            shutil.copyfile(image_path, dest_path)
+            students.append((usn, name, dob, class_id, pack_encoding(encoding)))
+            outcomes.append(("enrolled", None, item_id))
+
+    c.executemany("INSERT INTO students (usn, name, dob, class_id, face_encoding) VALUES (?,?,?,?,?)", students)
+    c.executemany("UPDATE enrollment_items SET status=?, message=? WHERE id=?", outcomes)
+    c.execute("UPDATE enrollment_jobs SET processed = processed + ? WHERE id=?", (len(batch), job_id))
+
+
+def job_status(job_id):
+    """Progress summary for the polling endpoint, including per-file failures."""
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("SELECT id, class_id, status, total, processed, created_at, message FROM enrollment_jobs WHERE id=?",
+              (job_id,))
+    job = c.fetchone()
+    if not job:
+        conn.close()
+        return None
+
+    c.execute("SELECT status, COUNT(*) FROM enrollment_items WHERE job_id=? GROUP BY status", (job_id,))
+    counts = dict(c.fetchall())
+    c.execute("SELECT usn, message FROM enrollment_items WHERE job_id=? AND status='failed' ORDER BY usn",
+              (job_id,))
+    failures = [{"usn": row[0], "message": row[1]} for row in c.fetchall()]
+    conn.close()
+
+    return {
+        "id": job[0],
+        "class_id": job[1],
+        "status": job[2],
+        "total": job[3],
+        "processed": job[4],
+        "created_at": job[5],
+        "message": job[6],
+        "pending": counts.get("pending", 0),
+        "enrolled": counts.get("enrolled", 0),
+        "failed": counts.get("failed", 0),
+        "failures": failures,
+        "running": job_id in _active_jobs
+    }
@@ -0,0 +1,39 @@
+import argparse
+from database import init_db
+from face_recog import run_live_attendance, DEFAULT_CAMERA_SOURCE, DEFAULT_SESSION_SECONDS
+from utils.attendance_aggregator import DEFAULT_MIN_HITS, DEFAULT_HIT_WINDOW
+from utils.face_matching import DEFAULT_TOLERANCE
+from utils.migrate_encodings import migrate_encodings
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Mark attendance headlessly from a camera, RTSP/HTTP stream or video file.")
+    parser.add_argument("--class-id", type=int, required=True)
+    parser.add_argument("--subject", required=True)
+    parser.add_argument("--hour", default="1", help="lecture hour (default: %(default)s)")
+    parser.add_argument("--source", default=DEFAULT_CAMERA_SOURCE,
+                        help="device index (0), stream URL or video file (default: %(default)s)")
+    parser.add_argument("--duration", type=float, default=DEFAULT_SESSION_SECONDS,
+                        help="session length in seconds (default: %(default)s)")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--min-hits", type=int, default=DEFAULT_MIN_HITS,
+                        help="matches needed to confirm a student (default: %(default)s)")
+    parser.add_argument("--hit-window", type=float, default=DEFAULT_HIT_WINDOW,
+                        help="seconds within which min-hits must occur (default: %(default)s)")
+    args = parser.parse_args()
+
+    init_db()
+    migrate_encodings(verbose=False)
+
+    summary = run_live_attendance(args.class_id, args.subject, tolerance=args.tolerance, source=args.source,
+                                  duration=args.duration, hour=args.hour, min_hits=args.min_hits,
+                                  hit_window=args.hit_window)
+    print(f"Processed {summary['frames_processed']} of {summary['frames_read']} frames "
+          f"({summary['frames_dropped']} dropped while recognition was busy).")
+    if not summary["written"]:
+        print("No frames were received from the source; attendance was not written.")
+        return
+    print(f"Present: {len(summary['present'])}, Absent: {len(summary['absent'])}")
+
+if __name__ == "__main__":
+    main()
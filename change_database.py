@@ -1,7 +1,7 @@
-import sqlite3
+from database import get_connection
 
 def tamper_data():
-    conn = sqlite3.connect('attendance.db')
+    conn = get_connection()
     c = conn.cursor()
     
     # 1. Get Class ID for 'CSE-C'
@@ -1,103 +1,133 @@
+import argparse
+import os
 import sqlite3
+import sys
+import threading
+from migrations import HOT_QUERIES, apply_migrations, explain_query_plan, full_scans, schema_version
+
+DB_PATH = "attendance.db"
+# Applied to every new connection. WAL lets dashboard reads run while attendance is
+# being written; busy_timeout makes a writer wait for the lock instead of failing.
+# cache_size is in KiB when negative, mmap_size and busy_timeout in bytes / milliseconds.
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -16000,
+    "mmap_size": 256 * 1024 * 1024,
+    "busy_timeout": 5000,
+    "temp_store": "MEMORY"
+}
+# Idle connections kept per database file; more can be open at once, extras are closed on release
+DEFAULT_POOL_SIZE = 8
+
+_settings = {"path": DB_PATH, "pragmas": dict(DEFAULT_PRAGMAS), "pool_size": DEFAULT_POOL_SIZE}
+_idle = {}
+_idle_lock = threading.Lock()
+
+
+class PooledConnection(sqlite3.Connection):
+    """
+    A connection handed out by get_connection(). close() returns it to the pool
+    (rolling back anything not committed) instead of closing the file.
+    A connection bound to a Flask request by get_db() stays owned by that request:
+    close() only rolls back, and the pool gets it back when the request ends.
+    """
+
+    def close(self):
+        if self.released:
+            return
+        if self.request_bound:
+            if self.in_transaction:
+                self.rollback()
+            return
+        self.released = True
+        if self.in_transaction:
+            self.rollback()
+        with _idle_lock:
+            idle = _idle.setdefault(self.pool_key, [])
+            if len(idle) < _settings["pool_size"]:
+                idle.append(self)
+                return
+        super().close()
+
+
+def configure(path=None, pool_size=None, **pragmas):
+    """Changes the database file, pool size or PRAGMAs; pooled connections are reopened with them."""
+    if path is not None:
+        _settings["path"] = path
+    if pool_size is not None:
+        _settings["pool_size"] = pool_size
+    _settings["pragmas"].update(pragmas)
+    close_idle_connections()
+
+
+def close_idle_connections():
+    with _idle_lock:
+        idle = [conn for conns in _idle.values() for conn in conns]
+        _idle.clear()
+    for conn in idle:
+        sqlite3.Connection.close(conn)
+
+
+def get_connection():
+    """
+    Returns a pooled connection to the attendance database with the configured
+    PRAGMAs applied. Call close() when done, as with sqlite3.connect().
+    Connections may move between threads but must only be used by one at a time.
+    """
+    # Relative paths follow the working directory, as sqlite3.connect() does
+    key = os.path.abspath(_settings["path"])
+    with _idle_lock:
+        idle = _idle.get(key)
+        conn = idle.pop() if idle else None
+    if conn is None:
+        conn = sqlite3.connect(key, factory=PooledConnection, check_same_thread=False)
+        conn.pool_key = key
+        for name, value in _settings["pragmas"].items():
+            conn.execute(f"PRAGMA {name}={value}")
+    conn.released = False
+    conn.request_bound = False
+    return conn
+
+
+def get_db():
+    """
+    Connection for the current Flask request; released when the app context ends.
+    Outside an app context (startup code, background threads) it is a plain pooled connection.
+    """
+    from flask import g, has_app_context
+    if not has_app_context():
+        return get_connection()
+    conn = g.get("db")
+    if conn is None:
+        conn = g.db = get_connection()
+        conn.request_bound = True
+    return conn
+
+
+def _release_db(exception=None):
+    from flask import g
+    conn = g.pop("db", None)
+    if conn is not None:
+        conn.request_bound = False
+        conn.close()
+
+
+def init_app(app):
+    """Applies the DB_* / SQLITE_* settings of a Flask app and releases request connections on teardown."""
+    configure(path=app.config.get("DB_PATH"),
+              pool_size=app.config.get("DB_POOL_SIZE"),
+              **{name: app.config["SQLITE_" + name.upper()] for name in DEFAULT_PRAGMAS
+                 if "SQLITE_" + name.upper() in app.config})
+    app.teardown_appcontext(_release_db)
+
 
 def init_db():
-    conn = sqlite3.connect('attendance.db')
+    """Brings the schema up to date (only pending migrations run) and seeds the default admin."""
+    conn = get_connection()
+    apply_migrations(conn)
     c = conn.cursor()
 
-    c.execute('''CREATE TABLE IF NOT EXISTS admin (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT UNIQUE,
-        password TEXT
-    )''')
-
-    c.execute('''CREATE TABLE IF NOT EXISTS students (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        usn TEXT UNIQUE,
-        name TEXT,
-        dob TEXT,
-        class_id INTEGER,
-        face_encoding BLOB
-    )''')
-
-    c.execute('''CREATE TABLE IF NOT EXISTS classes (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        class_name TEXT
-    )''')
-
-    c.execute('''CREATE TABLE IF NOT EXISTS timetable (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        class_id INTEGER,
-        subject TEXT,
-        start_time TEXT,
-        end_time TEXT
-    )''')
-
-    c.execute('''CREATE TABLE IF NOT EXISTS attendance (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        student_id INTEGER,
-        subject TEXT,
-        date TEXT,
-        status TEXT,
-        hour INTEGER,
-        previous_hash TEXT,
-        current_hash TEXT
-    )''')
-
-    # Migration: Add hash columns if they don't exist
-    try:
-        c.execute("ALTER TABLE attendance ADD COLUMN previous_hash TEXT")
-    except sqlite3.OperationalError:
-        pass  # Column likely already exists
-
-    try:
-        c.execute("ALTER TABLE attendance ADD COLUMN current_hash TEXT")
-    except sqlite3.OperationalError:
-        pass  # Column likely already exists
-
-    c.execute('''CREATE TABLE IF NOT EXISTS subjects (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        class_id INTEGER,
-        name TEXT
-    )''')
-
-    c.execute('''CREATE TABLE IF NOT EXISTS teachers (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        teacher_id TEXT UNIQUE,
-        name TEXT,
-        dob TEXT
-    )''')
-
-    c.execute('''CREATE TABLE IF NOT EXISTS teacher_assignments (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        teacher_id TEXT,
-        class_id INTEGER,
-        subject TEXT
-    )''')
-
-    c.execute('''CREATE TABLE IF NOT EXISTS pending_attendance_changes (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        attendance_id INTEGER,
-        new_status TEXT,
-        requested_by TEXT,
-        timestamp TEXT,
-        comment TEXT,
-        request_role TEXT,
-        document_path TEXT,
-        FOREIGN KEY(attendance_id) REFERENCES attendance(id)
-    )''')
-
-    # Migration: Add request_role column if it doesn't exist
-    try:
-        c.execute("ALTER TABLE pending_attendance_changes ADD COLUMN request_role TEXT")
-    except sqlite3.OperationalError:
-        pass  # Column likely already exists
-
-    # Migration: Add document_path column if it doesn't exist
-    try:
-        c.execute("ALTER TABLE pending_attendance_changes ADD COLUMN document_path TEXT")
-    except sqlite3.OperationalError:
-        pass  # Column likely already exists
-
     # Insert default admin if none exists
     c.execute("SELECT * FROM admin")
     if not c.fetchone():
@@ -106,5 +136,35 @@ def init_db():
     conn.commit()
     conn.close()
 
+
+def explain_hot_queries():
+    """Prints the query plan of each HOT_QUERIES entry and returns the number of full table scans."""
+    conn = get_connection()
+    c = conn.cursor()
+    print(f"Schema version {schema_version(c)}")
+    scans = 0
+    for name, query, params in HOT_QUERIES:
+        plan = explain_query_plan(c, query, params)
+        slow = full_scans(plan)
+        scans += len(slow)
+        print(f"{name}:")
+        for step in plan:
+            print(("  ! " if step in slow else "    ") + step)
+    conn.close()
+    return scans
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create or migrate attendance.db.")
+    parser.add_argument("--explain", action="store_true",
+                        help="print EXPLAIN QUERY PLAN for the app's hot queries; full scans are marked with !")
+    args = parser.parse_args()
+
+    conn = get_connection()
+    applied = apply_migrations(conn, verbose=True)
+    conn.close()
     init_db()
+    if not applied:
+        print("Schema is up to date.")
+    if args.explain and explain_hot_queries():
+        sys.exit(1)
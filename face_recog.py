@@ -1,123 +1,629 @@
 import face_recognition
 import cv2
-import pickle
 import datetime
-import sqlite3
+import hashlib
+import threading
+import time
+import numpy as np
+from collections import namedtuple
+from utils.encoding_cache import EncodingCache
+from utils.face_matching import DEFAULT_TOLERANCE, assign_matches, distance_matrix, match_faces
+from utils.face_matching import effective_tolerance, refine_with_references
+from utils.face_index import FaceIndex
+from utils.encoding_format import stack_encodings
+from utils.encoding_store import EncodingStore
+from utils.face_quality import filter_faces
+from utils.face_tracker import FaceTracker
+from utils.timing import StageTimer
+from utils.frame_grabber import FrameGrabber
+from utils.attendance_aggregator import AttendanceAggregator, DEFAULT_MIN_HITS, DEFAULT_HIT_WINDOW
+from database import get_connection
+
+# Same timezone as the web app, so headless sessions land on the same attendance date
+IST = datetime.timezone(datetime.timedelta(hours=5, minutes=30))
+
+# Headless live attendance (run_live_attendance): capture source and session length
+DEFAULT_CAMERA_SOURCE = "http://192.168.1.29:8080"
+DEFAULT_SESSION_SECONDS = 15
+
+# Maximum number of class galleries kept in memory at once
+ENCODING_CACHE_SIZE = 64
+
+# encodings holds one centroid per student. thresholds (NaN = session tolerance) and the
+# reference encodings with their owning column are None for classes that do not use them.
+ClassGallery = namedtuple("ClassGallery", ["encodings", "student_ids", "student_names",
+                                           "thresholds", "references", "reference_owners"],
+                          defaults=[None, None, None])
+
+# scale: detect on a copy resized by this factor (1.0 = full resolution, 0.5, 0.25, ...)
+# upsample_fallback: when the pass finds nothing, retry once with one more upsample
+# min_face_size / min_sharpness / max_yaw: quality gate run before encoding (0 = check disabled);
+# pixels of the shorter box side, Laplacian variance of the face crop, degrees of head turn
+DetectionSettings = namedtuple("DetectionSettings",
+                               ["scale", "upsample_fallback", "min_face_size", "min_sharpness", "max_yaw"],
+                               defaults=[1.0, False, 0, 0.0, 0.0])
+DEFAULT_DETECTION = DetectionSettings()
+
+_detection_settings = {}
+
+# Bumped on every roster change so recognition worker processes know their caches are stale
+_roster_version = 0
+_synced_roster_version = (0, frozenset())
+
+_gallery_cache = EncodingCache(max_classes=ENCODING_CACHE_SIZE)
+
+# Memory-mapped copy of all encodings shared by every process of the deployment.
+# Processes poll the CURRENT generation at most once per ENCODING_STORE_CHECK_INTERVAL seconds.
+ENCODING_STORE_DIR = "encoding_store"
+ENCODING_STORE_CHECK_INTERVAL = 1.0
+
+_encoding_store = EncodingStore(ENCODING_STORE_DIR)
+_encoding_store_checked_at = 0.0
+
+# Roster changes rebuild the store in the background, ENCODING_STORE_REBUILD_DELAY seconds
+# after the first one, so a burst of enrollments shares one rebuild. Until it is published
+# the changed classes are read from SQLite (ALL_CLASSES: every class).
+ENCODING_STORE_REBUILD_DELAY = 2.0
+ALL_CLASSES = "*"
+
+_stale_classes = frozenset()
+_store_changes = 0
+_store_rebuild_timer = None
+_store_lock = threading.Lock()
+_store_rebuild_lock = threading.Lock()
+
+# Institution-wide index used by "global" sessions (exams, labs, combined lectures).
+# GLOBAL_INDEX_PROBES trades recall for latency; GLOBAL_INDEX_LISTS=None sizes cells from the gallery.
+GLOBAL_INDEX_LISTS = None
+GLOBAL_INDEX_PROBES = 8
+
+_global_index = None
+_global_index_lock = threading.Lock()
+
+# The global index is versioned apart from class galleries. Enrollments and removals are
+# logged as changes that worker processes replay on their own copy; only a reset (or more
+# than GLOBAL_INDEX_MAX_CHANGES changes since the last one) makes them rebuild it.
+GLOBAL_INDEX_MAX_CHANGES = 64
+
+_global_generation = 0
+_global_changes = []
+# (generation, number of changes) the index of this process reflects
+_global_synced = (0, 0)
 
 def capture_face_encoding(image_path):
     img = face_recognition.load_image_file(image_path)
     encodings = face_recognition.face_encodings(img)
     return encodings[0] if encodings else None
 
-def run_live_attendance(class_id, subject):
-    conn = sqlite3.connect('attendance.db')
-    c = conn.cursor()
-    c.execute("SELECT id, face_encoding, name FROM students WHERE class_id=?", (class_id,))
-    students = c.fetchall()
+def encode_enrollment_image(image_path):
+    """
+    Encodes an enrollment photo, which must contain exactly one face.
+    Returns (encoding, None) or (None, reason) so bulk jobs can report per-file failures.
+    """
+    try:
+        img = face_recognition.load_image_file(image_path)
+    except Exception:
+        return None, "Unreadable image file"
+    face_locations = face_recognition.face_locations(img)
+    if not face_locations:
+        return None, "No face found"
+    if len(face_locations) > 1:
+        return None, "Multiple faces found"
+    return face_recognition.face_encodings(img, known_face_locations=face_locations)[0], None
 
-    known_encodings = []
-    student_ids = []
-    student_names = []
-    for sid, encoding_blob, name in students:
-        if encoding_blob:
-            known_encodings.append(pickle.loads(encoding_blob))
-            student_ids.append(sid)
-            student_names.append(name)
+def run_live_attendance(class_id, subject, tolerance=DEFAULT_TOLERANCE, source=DEFAULT_CAMERA_SOURCE,
+                        duration=DEFAULT_SESSION_SECONDS, hour=1, min_hits=DEFAULT_MIN_HITS,
+                        hit_window=DEFAULT_HIT_WINDOW, date=None):
+    """
+    Headless live attendance from a camera index, RTSP/HTTP stream or video file.
+    A capture thread keeps decoding while this thread recognizes the newest frame,
+    so neither stalls the other and no GUI is needed. Presence uses the same vote
+    rule as browser sessions and is written through the shared chained-hash writer.
+    Returns a summary dict.
+    """
+    gallery = get_class_gallery(class_id)
+    detection = get_class_detection_settings(class_id)
+    tracker = FaceTracker()
+    date = date or datetime.datetime.now(IST).strftime("%Y-%m-%d")
+    aggregator = AttendanceAggregator(class_id, subject, hour, date, min_hits, hit_window)
 
-    present_students = set()
-    cam = cv2.VideoCapture("http://192.168.1.29:8080")
-    start_time = datetime.datetime.now()
+    grabber = FrameGrabber(source).start()
+    deadline = time.monotonic() + duration
+    frames_processed = 0
+    try:
+        while time.monotonic() < deadline:
+            frame_id, frame = grabber.read(timeout=min(1.0, max(0.0, deadline - time.monotonic())))
+            if frame is None:
+                if grabber.finished:
+                    break
+                continue
+            results = process_frame(frame, gallery.encodings, gallery.student_ids, gallery.student_names,
+                                    tolerance, detection=detection, tracker=tracker,
+                                    thresholds=gallery.thresholds, references=gallery.references,
+                                    reference_owners=gallery.reference_owners)
+            aggregator.record(results)
+            frames_processed += 1
+    finally:
+        grabber.stop()
 
-    while True:
-        ret, frame = cam.read()
-        if not ret:
-            break
+    # A source that never delivered a frame must not mark the whole class absent
+    if frames_processed:
+        aggregator.finalize()
+    present_ids = aggregator.confirmed_ids()
+    summary = grabber.stats()
+    summary.update({
+        "frames_processed": frames_processed,
+        "written": frames_processed > 0,
+        "present": sorted(sid for sid in gallery.student_ids if sid in present_ids),
+        "absent": sorted(sid for sid in gallery.student_ids if sid not in present_ids)
+    })
+    return summary
 
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        face_locations = face_recognition.face_locations(rgb_frame)
-        face_encodings = face_recognition.face_encodings(rgb_frame, known_face_locations=face_locations)
+# --- NEW FUNCTIONS FOR BROWSER-BASED FLOW ---
 
-        for (top, right, bottom, left), encoding in zip(face_locations, face_encodings):
-            matches = face_recognition.compare_faces(known_encodings, encoding, tolerance=0.6)
-            name = "Unknown"
+def get_class_encodings(class_id):
+    """Fetches encodings for a specific class as an (N x 128) matrix plus ids and names."""
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("SELECT id, face_encoding, name FROM students WHERE class_id=? AND face_encoding IS NOT NULL",
+              (class_id,))
+    students = c.fetchall()
+    conn.close()
 
-            if True in matches:
-                idx = matches.index(True)
-                sid = student_ids[idx]
-                name = student_names[idx]
-                present_students.add(sid)
+    known_encodings = stack_encodings([row[1] for row in students])
+    student_ids = [row[0] for row in students]
+    student_names = [row[2] for row in students]
+    return known_encodings, student_ids, student_names
 
-            cv2.rectangle(frame, (left, top), (right, bottom), (0, 255, 0), 2)
-            cv2.putText(frame, name, (left, top - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.75, (0, 255, 0), 2)
+def get_class_references(class_id, student_ids):
+    """
+    Fetches per-student thresholds and reference encodings for the students of a class.
+    Returns (thresholds, references, reference_owners) aligned with student_ids,
+    where reference_owners is the index into student_ids of each reference row.
+    """
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("SELECT id, match_threshold FROM students WHERE class_id=? AND match_threshold IS NOT NULL",
+              (class_id,))
+    own_thresholds = dict(c.fetchall())
+    c.execute("""SELECT e.student_id, e.face_encoding FROM student_encodings e
+                 JOIN students s ON s.id = e.student_id
+                 WHERE s.class_id=? ORDER BY e.student_id, e.id""", (class_id,))
+    rows = c.fetchall()
+    conn.close()
 
-        cv2.imshow("Mark Attendance - Press Q to stop", frame)
+    thresholds = None
+    if own_thresholds:
+        thresholds = np.array([own_thresholds.get(sid, np.nan) for sid in student_ids], dtype=np.float64)
 
-        if (datetime.datetime.now() - start_time).seconds > 15:
-            break
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
+    column = {sid: i for i, sid in enumerate(student_ids)}
+    rows = [row for row in rows if row[0] in column]
+    if not rows:
+        return thresholds, None, None
+    references = stack_encodings([row[1] for row in rows])
+    references.flags.writeable = False
+    return thresholds, references, np.array([column[row[0]] for row in rows])
 
-    cam.release()
-    cv2.destroyAllWindows()
+def load_class_gallery(class_id):
+    """
+    Builds a ready-to-match gallery (N x 128 matrix plus id/name tuples) for a class.
+    The matrix is a view into the shared encoding store when the class is in it,
+    otherwise it is read from SQLite.
+    """
+    stored = None
+    if ALL_CLASSES not in _stale_classes and int(class_id) not in _stale_classes:
+        stored = _encoding_store.get_class(class_id)
+    if stored is not None:
+        matrix, student_ids, student_names, thresholds, references, reference_owners = stored
+        return ClassGallery(matrix, tuple(student_ids), tuple(student_names),
+                            thresholds, references, reference_owners)
 
-    date_today = datetime.date.today().strftime("%Y-%m-%d")
-    for sid in student_ids:
-        status = "Present" if sid in present_students else "Absent"
-        c.execute("INSERT INTO attendance (student_id, subject, date, status) VALUES (?,?,?,?)",
-                  (sid, subject, date_today, status))
+    matrix, student_ids, student_names = get_class_encodings(class_id)
+    thresholds, references, reference_owners = get_class_references(class_id, student_ids)
+    # The matrix is shared between request threads, so make sure nobody mutates it
+    matrix.flags.writeable = False
+    return ClassGallery(matrix, tuple(student_ids), tuple(student_names),
+                        thresholds, references, reference_owners)
 
-    conn.commit()
-    conn.close()
+def get_class_gallery(class_id):
+    """Returns the gallery for a class from the in-process LRU cache, loading it on a miss."""
+    _check_encoding_store()
+    return _gallery_cache.get(int(class_id), load_class_gallery)
 
-# --- NEW FUNCTIONS FOR BROWSER-BASED FLOW ---
+def invalidate_class_gallery(class_id=None):
+    """
+    Must be called whenever a class roster changes, after the change is committed.
+    None drops every cached class. The shared store is rebuilt in the background.
+    """
+    global _stale_classes, _store_changes, _store_rebuild_timer
+    with _store_lock:
+        _stale_classes = _stale_classes | {ALL_CLASSES if class_id is None else int(class_id)}
+        _store_changes += 1
+        if _store_rebuild_timer is None:
+            _store_rebuild_timer = threading.Timer(ENCODING_STORE_REBUILD_DELAY, _rebuild_stale_store)
+            _store_rebuild_timer.daemon = True
+            _store_rebuild_timer.start()
+    _gallery_cache.invalidate(None if class_id is None else int(class_id))
+    _bump_roster_version()
 
-def get_class_encodings(class_id):
-    """Fetches encodings for a specific class."""
-    conn = sqlite3.connect('attendance.db')
+def flush_encoding_store():
+    """Runs a pending background rebuild now (tests, scripts and shutdown)."""
+    global _store_rebuild_timer
+    with _store_lock:
+        timer, _store_rebuild_timer = _store_rebuild_timer, None
+    if timer is not None:
+        timer.cancel()
+        _rebuild_stale_store()
+
+def _rebuild_stale_store():
+    global _stale_classes, _store_rebuild_timer, _synced_roster_version
+    with _store_rebuild_lock:
+        with _store_lock:
+            _store_rebuild_timer = None
+            changes = _store_changes
+        try:
+            rebuild_encoding_store()
+        except Exception as e:
+            # The changed classes keep being read from the database
+            print(f"Could not rebuild encoding store: {e}")
+            return
+        with _store_lock:
+            # Changes made while rebuilding are not in this generation; their own rebuild clears them
+            if changes == _store_changes:
+                _stale_classes = frozenset()
+                # Galleries cached here were read from the database and stay valid
+                _synced_roster_version = roster_version()
+
+def rebuild_encoding_store(only_if_stale=False):
+    """
+    Writes a new generation of the shared encoding store from the students table.
+    With only_if_stale, an existing store built from the same rows is reused, so
+    starting another process does not invalidate the caches of the running ones.
+    """
+    conn = get_connection()
     c = conn.cursor()
-    c.execute("SELECT id, face_encoding, name FROM students WHERE class_id=?", (class_id,))
+    c.execute("""SELECT class_id, id, name, face_encoding, match_threshold FROM students
+                 WHERE face_encoding IS NOT NULL ORDER BY class_id, id""")
     students = c.fetchall()
+    c.execute("SELECT student_id, face_encoding FROM student_encodings ORDER BY student_id, id")
+    references = c.fetchall()
     conn.close()
 
-    known_encodings = []
-    student_ids = []
-    student_names = []
-    for sid, encoding_blob, name in students:
-        if encoding_blob:
-            known_encodings.append(pickle.loads(encoding_blob))
-            student_ids.append(sid)
-            student_names.append(name)
-    
-    return known_encodings, student_ids, student_names
+    digest = hashlib.sha1()
+    for row in students + references:
+        digest.update(repr(row).encode())
+    source = digest.hexdigest()
+    if only_if_stale and _encoding_store.current_source() == source:
+        _encoding_store.refresh()
+        return
+    try:
+        _encoding_store.build(students, references, source=source)
+    except OSError as e:
+        print(f"Could not rebuild encoding store, serving galleries from the database: {e}")
+        _encoding_store.disable()
+        return
+    # This process already knows which class changed, so only remap here
+    _encoding_store.refresh()
+
+def _check_encoding_store(force=False):
+    """Remaps the store when another process rebuilt it; cached galleries are then dropped."""
+    global _encoding_store_checked_at
+    now = time.monotonic()
+    if not force and now - _encoding_store_checked_at < ENCODING_STORE_CHECK_INTERVAL:
+        return
+    _encoding_store_checked_at = now
+    if _encoding_store.refresh():
+        _gallery_cache.invalidate()
+
+def _bump_roster_version():
+    global _roster_version, _synced_roster_version
+    _roster_version += 1
+    _synced_roster_version = roster_version()
+
+def roster_version():
+    """(version, classes not yet in the shared store); changes whenever either does."""
+    return _roster_version, _stale_classes
 
-def process_frame(frame, known_encodings, student_ids, student_names):
+def sync_roster_version(version):
+    """
+    Called in worker processes with the parent's roster_version(). When it moved,
+    every cached gallery and detection setting is dropped.
+    """
+    global _synced_roster_version, _stale_classes
+    if version != _synced_roster_version:
+        _stale_classes = version[1]
+        _check_encoding_store(force=True)
+        _gallery_cache.invalidate()
+        _detection_settings.clear()
+        _synced_roster_version = version
+
+def gallery_cache_stats():
+    stats = _gallery_cache.stats()
+    stats["store_generation"] = _encoding_store.generation
+    return stats
+
+def get_class_detection_settings(class_id):
+    """Returns the detection settings configured for a class/room (cached until changed)."""
+    class_id = int(class_id)
+    settings = _detection_settings.get(class_id)
+    if settings is None:
+        conn = get_connection()
+        c = conn.cursor()
+        c.execute("""SELECT detection_scale, upsample_fallback, min_face_size, min_sharpness, max_yaw
+                     FROM classes WHERE id=?""", (class_id,))
+        row = c.fetchone()
+        conn.close()
+        if row:
+            settings = DetectionSettings(row[0] or 1.0, bool(row[1]), row[2] or 0, row[3] or 0.0, row[4] or 0.0)
+        else:
+            settings = DEFAULT_DETECTION
+        _detection_settings[class_id] = settings
+    return settings
+
+def invalidate_detection_settings(class_id):
+    _detection_settings.pop(int(class_id), None)
+    _bump_roster_version()
+
+def get_global_index():
+    """Returns the institution-wide face index, building it from every student on first use."""
+    global _global_index
+    with _global_index_lock:
+        if _global_index is None:
+            conn = get_connection()
+            c = conn.cursor()
+            c.execute("SELECT id, face_encoding, name FROM students WHERE face_encoding IS NOT NULL")
+            students = c.fetchall()
+            conn.close()
+
+            index = FaceIndex(n_lists=GLOBAL_INDEX_LISTS, n_probe=GLOBAL_INDEX_PROBES)
+            index.add_many([row[0] for row in students],
+                           [row[2] for row in students],
+                           stack_encodings([row[1] for row in students]))
+            _global_index = index
+        return _global_index
+
+def add_to_global_index(student_id, name, encoding):
+    """Adds a newly enrolled student. Does nothing until the index has been built."""
+    _record_global_change(("add", student_id, name, np.asarray(encoding, dtype=np.float64)))
+    _bump_roster_version()
+
+def remove_from_global_index(student_id):
+    _record_global_change(("remove", student_id))
+    _bump_roster_version()
+
+def reset_global_index():
+    """Drops the index so it is rebuilt from the database on next use."""
+    global _global_generation, _global_synced
+    with _global_index_lock:
+        _global_generation += 1
+        _global_changes.clear()
+        _global_synced = (_global_generation, 0)
+    _drop_global_index()
+    _bump_roster_version()
+
+def global_index_state():
+    """(generation, changes) sent with global-mode tasks so workers can update their index."""
+    with _global_index_lock:
+        return _global_generation, list(_global_changes)
+
+def sync_global_index(state):
+    """
+    Called in worker processes with the parent's global_index_state(). Changes the
+    worker has not seen are applied to its index; a new generation drops the index.
+    """
+    global _global_synced
+    generation, changes = state
+    with _global_index_lock:
+        synced_generation, applied = _global_synced
+        if generation != synced_generation or applied > len(changes):
+            _global_synced = (generation, len(changes))
+            rebuild = True
+        else:
+            _apply_global_changes(changes[applied:])
+            _global_synced = (generation, len(changes))
+            rebuild = False
+    if rebuild:
+        _drop_global_index()
+
+def _record_global_change(change):
+    global _global_generation, _global_synced
+    with _global_index_lock:
+        if len(_global_changes) >= GLOBAL_INDEX_MAX_CHANGES:
+            # Replaying a long log costs more than letting workers rebuild from the database
+            _global_generation += 1
+            _global_changes.clear()
+        else:
+            _global_changes.append(change)
+        _apply_global_changes([change])
+        _global_synced = (_global_generation, len(_global_changes))
+
+def _apply_global_changes(changes):
+    # Caller holds _global_index_lock. Replaying is idempotent: add replaces, remove ignores missing ids,
+    # so changes already contained in an index built from the database do no harm.
+    if _global_index is None:
+        return
+    for change in changes:
+        if change[0] == "add":
+            _global_index.add(*change[1:])
+        else:
+            _global_index.remove(change[1])
+
+def _drop_global_index():
+    global _global_index
+    with _global_index_lock:
+        _global_index = None
+
+def detect_faces(rgb_frame, detection=DEFAULT_DETECTION):
+    """
+    Runs HOG detection, optionally on a downscaled copy of the frame.
+    Boxes are always returned in full-resolution coordinates.
+    """
+    scale = detection.scale
+    if scale and scale < 1.0:
+        small_frame = cv2.resize(rgb_frame, (0, 0), fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    else:
+        scale = 1.0
+        small_frame = rgb_frame
+
+    face_locations = face_recognition.face_locations(small_frame)
+    if not face_locations and detection.upsample_fallback:
+        # Second pass only when the cheap pass found nothing (small or distant faces)
+        face_locations = face_recognition.face_locations(small_frame, number_of_times_to_upsample=2)
+
+    if scale == 1.0:
+        return face_locations
+
+    height, width = rgb_frame.shape[:2]
+    return [(max(0, int(top / scale)), min(width, int(right / scale)),
+             min(height, int(bottom / scale)), max(0, int(left / scale)))
+            for top, right, bottom, left in face_locations]
+
+def _face_landmarks(rgb_frame, face_locations):
+    # The 5-point model is enough for the pose check and much cheaper than the 68-point one
+    return face_recognition.face_landmarks(rgb_frame, face_locations, model="small")
+
+def select_quality_faces(rgb_frame, face_locations, detection=DEFAULT_DETECTION):
+    """
+    Drops boxes that are too small, too blurred or too far turned to be worth an
+    encoding, per the class detection settings. Returns the boxes kept.
+    """
+    if not (detection.min_face_size or detection.min_sharpness or detection.max_yaw):
+        return face_locations
+    keep = filter_faces(rgb_frame, face_locations, detection.min_face_size, detection.min_sharpness,
+                        detection.max_yaw, landmarks_fn=_face_landmarks)
+    return [face_locations[i] for i in keep]
+
+def identify_faces(face_encodings, known_encodings, student_ids, student_names, tolerance=DEFAULT_TOLERANCE,
+                   mode="class", n_probe=None, thresholds=None, references=None, reference_owners=None):
+    """
+    Matches encodings against the class gallery (or the global index).
+    Returns parallel lists of student ids, names and distances, None for unknown faces.
+    """
+    if len(face_encodings) == 0:
+        return [], [], []
+
+    if mode == "global":
+        return get_global_index().match(face_encodings, tolerance, n_probe)
+
+    matches, match_distances = match_faces(face_encodings, known_encodings, tolerance,
+                                           thresholds, references, reference_owners)
+    matched_ids = [student_ids[idx] if idx >= 0 else None for idx in matches]
+    matched_names = [student_names[idx] if idx >= 0 else None for idx in matches]
+    distances = [float(d) if idx >= 0 else None for idx, d in zip(matches, match_distances)]
+    return matched_ids, matched_names, distances
+
+def process_frame(frame, known_encodings, student_ids, student_names, tolerance=DEFAULT_TOLERANCE,
+                  mode="class", n_probe=None, detection=DEFAULT_DETECTION, tracker=None, stats=None,
+                  thresholds=None, references=None, reference_owners=None):
     """
     Processes a single frame for face recognition.
     Returns a list of detected faces with bounding boxes and names.
+    All faces are matched against the gallery at once and no student is assigned twice.
+
+    mode="global" ignores the class gallery and searches the institution-wide index;
+    n_probe overrides how many index cells are scanned per face.
+    detection selects the detection scale and the quality gate; encodings are always taken
+    at full resolution and faces rejected by the gate are left out of the results.
+    With a FaceTracker, faces whose identity is still confirmed from earlier frames
+    are not encoded again. If a stats dict is given it receives per-frame counters
+    and the wall time of each stage in stats["timings"] (seconds).
+    thresholds / references / reference_owners come from the ClassGallery (see match_faces).
     """
+    timer = StageTimer()
     # Convert the image from BGR color (which OpenCV uses) to RGB color (which face_recognition uses)
-    rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-    
-    face_locations = face_recognition.face_locations(rgb_frame)
-    face_encodings = face_recognition.face_encodings(rgb_frame, known_face_locations=face_locations)
+    with timer.stage("convert"):
+        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
 
-    results = []
+    with timer.stage("detect"):
+        detected = detect_faces(rgb_frame, detection)
+    with timer.stage("quality"):
+        face_locations = select_quality_faces(rgb_frame, detected, detection)
+
+    if tracker is not None:
+        tracks = tracker.associate(face_locations)
+        to_encode = [i for i, track in enumerate(tracks) if tracker.needs_encoding(track)]
+    else:
+        tracks = None
+        to_encode = list(range(len(face_locations)))
+
+    with timer.stage("encode"):
+        face_encodings = face_recognition.face_encodings(
+            rgb_frame, known_face_locations=[face_locations[i] for i in to_encode])
+    with timer.stage("match"):
+        matched_ids, matched_names, distances = identify_faces(
+            face_encodings, known_encodings, student_ids, student_names, tolerance, mode, n_probe,
+            thresholds, references, reference_owners)
 
-    for (top, right, bottom, left), encoding in zip(face_locations, face_encodings):
-        matches = face_recognition.compare_faces(known_encodings, encoding, tolerance=0.6)
-        name = "Unknown"
-        student_id = None
+    if tracker is not None:
+        for i, student_id, name, distance in zip(to_encode, matched_ids, matched_names, distances):
+            tracker.update_identity(tracks[i], student_id, name, distance)
+        identities = [(t.student_id, t.name, t.distance) for t in tracks]
+    else:
+        identities = list(zip(matched_ids, matched_names, distances))
 
-        if True in matches:
-            idx = matches.index(True)
-            student_id = student_ids[idx]
-            name = student_names[idx]
+    if stats is not None:
+        stats["detected"] = len(detected)
+        stats["filtered"] = len(detected) - len(face_locations)
+        stats["encoded"] = len(to_encode)
+        stats["timings"] = timer.stages
 
+    results = []
+
+    for (top, right, bottom, left), (student_id, name, distance) in zip(face_locations, identities):
         results.append({
             "box": [top, right, bottom, left],
-            "name": name,
-            "student_id": student_id
+            "name": name if student_id is not None else "Unknown",
+            "student_id": student_id,
+            "distance": round(distance, 4) if distance is not None else None
         })
     
     return results
 
+def process_frames(frames, known_encodings, student_ids, student_names, tolerance=DEFAULT_TOLERANCE,
+                   detection=DEFAULT_DETECTION, min_frames=1, thresholds=None, references=None,
+                   reference_owners=None):
+    """
+    Recognizes a burst of frames of one class in a single pass.
+    Faces from every frame are encoded first and then matched with one distance
+    matrix against the gallery; assignments stay unique within each frame.
+    Returns (per-frame results, presence) where presence lists students seen in
+    at least min_frames frames with their hit count and best distance.
+    """
+    locations_per_frame = []
+    all_encodings = []
+    for frame in frames:
+        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        face_locations = select_quality_faces(rgb_frame, detect_faces(rgb_frame, detection), detection)
+        locations_per_frame.append(face_locations)
+        all_encodings.extend(face_recognition.face_encodings(rgb_frame, known_face_locations=face_locations))
+
+    tolerance = effective_tolerance(tolerance, thresholds)
+    distances = distance_matrix(all_encodings, known_encodings)
+    distances = refine_with_references(distances, all_encodings, references, reference_owners, tolerance)
+
+    frame_results = []
+    sightings = {}
+    offset = 0
+    for face_locations in locations_per_frame:
+        rows = distances[offset:offset + len(face_locations)]
+        offset += len(face_locations)
+        matches, match_distances = assign_matches(rows, tolerance)
+
+        results = []
+        for (top, right, bottom, left), idx, distance in zip(face_locations, matches, match_distances):
+            student_id = student_ids[idx] if idx >= 0 else None
+            results.append({
+                "box": [top, right, bottom, left],
+                "name": student_names[idx] if idx >= 0 else "Unknown",
+                "student_id": student_id,
+                "distance": round(float(distance), 4) if idx >= 0 else None
+            })
+            if student_id is not None:
+                seen = sightings.setdefault(student_id, {"student_id": student_id, "name": student_names[idx],
+                                                         "frames": 0, "best_distance": float(distance)})
+                seen["frames"] += 1
+                seen["best_distance"] = round(min(seen["best_distance"], float(distance)), 4)
+        frame_results.append(results)
+
+    presence = [seen for seen in sightings.values() if seen["frames"] >= min_frames]
+    return frame_results, presence
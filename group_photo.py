@@ -0,0 +1,100 @@
+import cv2
+import face_recog
+from utils.face_matching import DEFAULT_TOLERANCE
+from utils.tiling import tile_grid, merge_boxes
+from utils.timing import StageTimer
+
+# Tiles are detected at full resolution; the overlap must exceed the largest expected face
+TILE_SIZE = 1024
+TILE_OVERLAP = 192
+# HOG finds faces down to ~40 px with one upsample; 2 also finds smaller ones at ~4x the cost
+DEFAULT_UPSAMPLE = 1
+# Refuse images larger than this (pixels) instead of running out of memory
+MAX_IMAGE_PIXELS = 50_000_000
+# A 50 MP photo takes far longer than one video frame, so it gets its own deadline
+DEFAULT_TIMEOUT = 60.0
+
+
+def detect_tile(tile_rgb, upsample, detection):
+    """
+    Finds and encodes the faces of one tile.
+    Boxes are returned in tile coordinates. Faces in the overlap are encoded by
+    both neighbouring tiles; the duplicate is dropped when the tiles are merged.
+    """
+    locations = face_recog.face_recognition.face_locations(tile_rgb, number_of_times_to_upsample=upsample)
+    locations = face_recog.select_quality_faces(tile_rgb, locations, detection)
+    encodings = face_recog.face_recognition.face_encodings(tile_rgb, known_face_locations=locations)
+    return locations, encodings
+
+
+def detect_tiles(tiles_rgb, upsample, detection):
+    """Worker entry point for a share of the tiles of one photo."""
+    return [detect_tile(tile_rgb, upsample, detection) for tile_rgb in tiles_rgb]
+
+
+def recognize_group_photo(image, class_id, tolerance=DEFAULT_TOLERANCE, upsample=DEFAULT_UPSAMPLE, stats=None,
+                          pool=None, timeout=DEFAULT_TIMEOUT):
+    """
+    Recognizes everyone in one large class photo (BGR image).
+    The photo is split into overlapping tiles that are detected and encoded on the
+    recognition pool (inline without one), one share of the tiles per worker; boxes
+    found twice across tile borders are merged and all faces are matched against the
+    class gallery in one pass. The pool's PoolBusy/PoolTimeout propagate.
+    Returns results in the same format as process_frame. If a stats dict is given it
+    receives tile/face counts and stage timings (seconds).
+    """
+    height, width = image.shape[:2]
+    if height * width > MAX_IMAGE_PIXELS:
+        raise ValueError(f"Image too large (at most {MAX_IMAGE_PIXELS // 1_000_000} MP)")
+
+    timer = StageTimer()
+    with timer.stage("convert"):
+        rgb_image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    detection = face_recog.get_class_detection_settings(class_id)
+    tiles = tile_grid(height, width, TILE_SIZE, TILE_OVERLAP)
+    crops = [rgb_image[top:bottom, left:right] for top, left, bottom, right in tiles]
+
+    with timer.stage("detect"):
+        if pool is None:
+            found = detect_tiles(crops, upsample, detection)
+        else:
+            shares = max(1, min(pool.workers, pool.max_pending, len(crops)))
+            found = [None] * len(crops)
+            results = pool.run_many(detect_tiles, [(crops[i::shares], upsample, detection) for i in range(shares)],
+                                    timeout=timeout)
+            for i, share in enumerate(results):
+                found[i::shares] = share
+
+    boxes = []
+    encodings = []
+    for (tile_top, tile_left, _, _), (locations, tile_encodings) in zip(tiles, found):
+        boxes.extend((top + tile_top, right + tile_left, bottom + tile_top, left + tile_left)
+                     for top, right, bottom, left in locations)
+        encodings.extend(tile_encodings)
+    with timer.stage("merge"):
+        keep = merge_boxes(boxes)
+    detected = len(boxes)
+    boxes = [boxes[i] for i in keep]
+    encodings = [encodings[i] for i in keep]
+
+    with timer.stage("match"):
+        gallery = face_recog.get_class_gallery(class_id)
+        matched_ids, matched_names, distances = face_recog.identify_faces(
+            encodings, gallery.encodings, gallery.student_ids, gallery.student_names, tolerance,
+            thresholds=gallery.thresholds, references=gallery.references,
+            reference_owners=gallery.reference_owners)
+
+    if stats is not None:
+        stats["tiles"] = len(tiles)
+        stats["detected"] = detected
+        stats["duplicates"] = detected - len(boxes)
+        stats["faces"] = len(boxes)
+        stats["timings"] = timer.stages
+
+    return [{
+        "box": [top, right, bottom, left],
+        "name": name if student_id is not None else "Unknown",
+        "student_id": student_id,
+        "distance": round(distance, 4) if distance is not None else None
+    } for (top, right, bottom, left), student_id, name, distance
+        in zip(boxes, matched_ids, matched_names, distances)]
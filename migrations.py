@@ -0,0 +1,345 @@
+import datetime
+from utils.hashing import find_chain_break, recalculate_chain
+
+# Versioned schema changes for attendance.db. Each migration runs once, in order, and
+# records itself in schema_version. Migrations must be idempotent: version 1 also runs
+# on databases created before versioning existed, which already have some of its tables.
+
+
+def _add_column(c, table, column_def):
+    """ALTER TABLE ... ADD COLUMN unless the column is already there."""
+    column = column_def.split()[0]
+    c.execute(f"PRAGMA table_info({table})")
+    if column not in {row[1] for row in c.fetchall()}:
+        c.execute(f"ALTER TABLE {table} ADD COLUMN {column_def}")
+
+
+def _baseline(c):
+    c.execute('''CREATE TABLE IF NOT EXISTS admin (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE,
+        password TEXT
+    )''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS students (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        usn TEXT UNIQUE,
+        name TEXT,
+        dob TEXT,
+        class_id INTEGER,
+        face_encoding BLOB
+    )''')
+    # Optional per-student match threshold (NULL = session tolerance)
+    _add_column(c, "students", "match_threshold REAL")
+
+    # Reference encodings of a student; students.face_encoding holds their centroid
+    c.execute('''CREATE TABLE IF NOT EXISTS student_encodings (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        student_id INTEGER,
+        face_encoding BLOB,
+        FOREIGN KEY(student_id) REFERENCES students(id)
+    )''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS classes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        class_name TEXT
+    )''')
+    # Per-class detection settings (large halls detect on a smaller copy)
+    _add_column(c, "classes", "detection_scale REAL DEFAULT 1.0")
+    _add_column(c, "classes", "upsample_fallback INTEGER DEFAULT 0")
+    # Per-class face quality gate (0 disables a check)
+    _add_column(c, "classes", "min_face_size INTEGER DEFAULT 0")
+    _add_column(c, "classes", "min_sharpness REAL DEFAULT 0")
+    _add_column(c, "classes", "max_yaw REAL DEFAULT 0")
+
+    c.execute('''CREATE TABLE IF NOT EXISTS timetable (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        class_id INTEGER,
+        subject TEXT,
+        start_time TEXT,
+        end_time TEXT
+    )''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS attendance (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        student_id INTEGER,
+        subject TEXT,
+        date TEXT,
+        status TEXT,
+        hour INTEGER,
+        previous_hash TEXT,
+        current_hash TEXT
+    )''')
+    # Databases from before lecture hours and the hash chain
+    _add_column(c, "attendance", "hour INTEGER DEFAULT 1")
+    _add_column(c, "attendance", "previous_hash TEXT")
+    _add_column(c, "attendance", "current_hash TEXT")
+
+    c.execute('''CREATE TABLE IF NOT EXISTS subjects (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        class_id INTEGER,
+        name TEXT
+    )''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS teachers (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        teacher_id TEXT UNIQUE,
+        name TEXT,
+        dob TEXT
+    )''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS teacher_assignments (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        teacher_id TEXT,
+        class_id INTEGER,
+        subject TEXT
+    )''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS pending_attendance_changes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        attendance_id INTEGER,
+        new_status TEXT,
+        requested_by TEXT,
+        timestamp TEXT,
+        comment TEXT,
+        request_role TEXT,
+        document_path TEXT,
+        FOREIGN KEY(attendance_id) REFERENCES attendance(id)
+    )''')
+    _add_column(c, "pending_attendance_changes", "request_role TEXT")
+    _add_column(c, "pending_attendance_changes", "document_path TEXT")
+
+    # Bulk enrollment jobs: one row per upload, one item per roster entry / image
+    c.execute('''CREATE TABLE IF NOT EXISTS enrollment_jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        class_id INTEGER,
+        status TEXT,
+        total INTEGER DEFAULT 0,
+        processed INTEGER DEFAULT 0,
+        created_at TEXT,
+        message TEXT
+    )''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS enrollment_items (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        job_id INTEGER,
+        usn TEXT,
+        name TEXT,
+        dob TEXT,
+        image_path TEXT,
+        status TEXT,
+        message TEXT,
+        FOREIGN KEY(job_id) REFERENCES enrollment_jobs(id)
+    )''')
+
+    # Offline attendance from lecture recordings: one row per upload, one chunk per slice of the timeline
+    c.execute('''CREATE TABLE IF NOT EXISTS video_jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        class_id INTEGER,
+        subject TEXT,
+        hour TEXT,
+        date TEXT,
+        video_path TEXT,
+        fps REAL,
+        sample_fps REAL,
+        min_frames INTEGER,
+        status TEXT,
+        total INTEGER DEFAULT 0,
+        processed INTEGER DEFAULT 0,
+        present INTEGER,
+        created_at TEXT,
+        message TEXT
+    )''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS video_chunks (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        job_id INTEGER,
+        start_frame INTEGER,
+        end_frame INTEGER,
+        status TEXT,
+        result TEXT,
+        FOREIGN KEY(job_id) REFERENCES video_jobs(id)
+    )''')
+
+    # Server-side live attendance sessions and the per-student votes collected in them
+    c.execute('''CREATE TABLE IF NOT EXISTS attendance_sessions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        class_id INTEGER,
+        subject TEXT,
+        hour TEXT,
+        date TEXT,
+        status TEXT,
+        created_at TEXT,
+        finalized_at TEXT,
+        UNIQUE(class_id, subject, hour, date)
+    )''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS attendance_sightings (
+        session_id INTEGER,
+        student_id INTEGER,
+        hits INTEGER DEFAULT 0,
+        best_distance REAL,
+        confirmed INTEGER DEFAULT 0,
+        last_seen TEXT,
+        PRIMARY KEY(session_id, student_id),
+        FOREIGN KEY(session_id) REFERENCES attendance_sessions(id)
+    )''')
+
+
+def _lookup_indexes(c):
+    # Marking attendance, student history and the dashboards look rows up by student first
+    c.execute("CREATE INDEX IF NOT EXISTS idx_attendance_student_subject_date_hour "
+              "ON attendance(student_id, subject, date, hour)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_students_class ON students(class_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_pending_changes_attendance "
+              "ON pending_attendance_changes(attendance_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_teacher_assignments_teacher_class "
+              "ON teacher_assignments(teacher_id, class_id)")
+    # Child rows read or deleted together with their parent
+    c.execute("CREATE INDEX IF NOT EXISTS idx_student_encodings_student ON student_encodings(student_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_enrollment_items_job ON enrollment_items(job_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_video_chunks_job ON video_chunks(job_id)")
+
+
+def _unique_attendance(c):
+    # Older databases can hold several rows for one lecture (e.g. two browsers submitting at
+    # once). The latest row holds the last submitted status and is kept; change requests are
+    # moved to it and the removed rows are copied to attendance_duplicates.
+    c.execute("""SELECT a.id, keep.id FROM attendance a
+                 JOIN (SELECT MAX(id) AS id, student_id, subject, date, hour FROM attendance
+                       GROUP BY student_id, subject, date, hour HAVING COUNT(*) > 1) keep
+                   ON a.student_id = keep.student_id AND a.subject = keep.subject
+                  AND a.date = keep.date AND a.hour = keep.hour
+                 WHERE a.id != keep.id""")
+    duplicates = c.fetchall()
+    note = None
+    if duplicates:
+        # Relinking rehashes every row after the first removed one, which would also hide
+        # any earlier tampering there; only an intact chain is relinked
+        chain_break = find_chain_break(c)
+        c.execute("""CREATE TABLE IF NOT EXISTS attendance_duplicates AS
+                     SELECT *, 0 AS kept_id, '' AS removed_at FROM attendance WHERE 0""")
+        removed_at = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        c.executemany("INSERT INTO attendance_duplicates SELECT *, ?, ? FROM attendance WHERE id=?",
+                      [(kept, removed_at, dup) for dup, kept in duplicates])
+        c.executemany("UPDATE pending_attendance_changes SET attendance_id=? WHERE attendance_id=?",
+                      [(kept, dup) for dup, kept in duplicates])
+        c.executemany("DELETE FROM attendance WHERE id=?", [(dup,) for dup, _ in duplicates])
+        note = f"Removed {len(duplicates)} duplicate attendance rows (copied to attendance_duplicates)"
+        if chain_break is None:
+            recalculate_chain(c, min(dup for dup, _ in duplicates))
+            note += " and relinked the hash chain after them."
+        else:
+            note += (f"; the hash chain was already broken at record ID {chain_break},"
+                     " so its hashes were left unchanged.")
+    # The unique index serves the same lookups as the plain one it replaces
+    c.execute("DROP INDEX IF EXISTS idx_attendance_student_subject_date_hour")
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_attendance_lecture "
+              "ON attendance(student_id, subject, date, hour)")
+    return note
+
+
+def _video_job_owner(c):
+    # The process running a job and when it last reported, so a restarting web worker
+    # only interrupts jobs whose owner is gone, not those of its running siblings
+    _add_column(c, "video_jobs", "owner_pid INTEGER")
+    _add_column(c, "video_jobs", "heartbeat_at REAL")
+
+
+# (version, description, function(cursor)); append new migrations, never reorder or edit applied ones.
+# A migration may return a note about what it changed, printed by apply_migrations(verbose=True).
+MIGRATIONS = [
+    (1, "Baseline schema (tables and columns added before versioning)", _baseline),
+    (2, "Indexes for attendance, roster, change-request and assignment lookups", _lookup_indexes),
+    (3, "One attendance row per student and lecture", _unique_attendance),
+    (4, "Owner process and heartbeat of video jobs", _video_job_owner),
+]
+
+
+def schema_version(c):
+    """Highest migration applied to the database (0 for a new or unversioned one)."""
+    c.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='schema_version'")
+    if not c.fetchone():
+        return 0
+    c.execute("SELECT MAX(version) FROM schema_version")
+    return c.fetchone()[0] or 0
+
+
+def apply_migrations(conn, verbose=False):
+    """
+    Applies the migrations newer than the database's schema_version, each in its own
+    transaction. BEGIN IMMEDIATE makes concurrently starting processes take turns, and
+    each re-checks the version once it holds the lock. Returns the versions applied.
+    """
+    c = conn.cursor()
+    latest = MIGRATIONS[-1][0]
+    if schema_version(c) >= latest:
+        return []
+
+    applied = []
+    for version, description, migrate in MIGRATIONS:
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            c.execute('''CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT,
+                applied_at TEXT
+            )''')
+            if schema_version(c) >= version:
+                conn.rollback()
+                continue
+            note = migrate(c)
+            c.execute("INSERT INTO schema_version (version, description, applied_at) VALUES (?,?,?)",
+                      (version, description, datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+        if verbose:
+            print(f"Applied migration {version}: {description}")
+            if note:
+                print(f"  {note}")
+    return applied
+
+
+# Representative queries of the app, checked by `python database.py --explain` and tests/test_migrations.py
+HOT_QUERIES = [
+    ("existing rows of a lecture",
+     """SELECT student_id FROM attendance
+        WHERE subject=? AND date=? AND hour=?
+        AND student_id IN (SELECT id FROM students WHERE class_id=?)""", ("x", "2024-01-01", 1, 1)),
+    ("student history",
+     "SELECT subject, date, status, hour FROM attendance WHERE student_id=?", (1,)),
+    ("class roster",
+     "SELECT id, usn, name FROM students WHERE class_id=? ORDER BY name", (1,)),
+    ("class gallery",
+     "SELECT id, face_encoding, name FROM students WHERE class_id=? AND face_encoding IS NOT NULL", (1,)),
+    ("present in session",
+     """SELECT attendance.student_id, students.name FROM attendance
+        JOIN students ON attendance.student_id = students.id
+        WHERE students.class_id=? AND attendance.subject=? AND attendance.date=? AND attendance.hour=?
+        AND attendance.status='Present'""", (1, "x", "2024-01-01", 1)),
+    ("pending change for record",
+     "SELECT id, request_role FROM pending_attendance_changes WHERE attendance_id=?", (1,)),
+    ("pending changes of class",
+     """SELECT DISTINCT attendance_id FROM pending_attendance_changes
+        WHERE attendance_id IN (SELECT id FROM attendance WHERE student_id IN
+            (SELECT id FROM students WHERE class_id=?))""", (1,)),
+    ("teacher classes",
+     """SELECT DISTINCT c.id, c.class_name FROM classes c
+        JOIN teacher_assignments ta ON c.id = ta.class_id WHERE ta.teacher_id=?""", ("T1",)),
+    ("teacher subjects",
+     "SELECT subject FROM teacher_assignments WHERE teacher_id=? AND class_id=? ORDER BY subject", ("T1", 1)),
+]
+
+
+def explain_query_plan(c, query, params=()):
+    """The EXPLAIN QUERY PLAN steps of a query as strings (e.g. 'SEARCH students USING INDEX ...')."""
+    c.execute("EXPLAIN QUERY PLAN " + query, params)
+    return [row[3] for row in c.fetchall()]
+
+
+def full_scans(plan):
+    """Steps of a plan that read a whole table instead of using an index."""
+    return [step for step in plan if step.startswith("SCAN") and " USING " not in step]
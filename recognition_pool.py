@@ -0,0 +1,265 @@
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+import cv2
+import numpy as np
+import face_recog
+from utils.timing import StageTimer
+
+
+class PoolBusy(Exception):
+    """Raised when the recognition queue is full; the caller should retry later."""
+
+
+class PoolRestarting(PoolBusy):
+    """Raised when a worker process died; the pool is replaced and the caller should retry."""
+
+
+class PoolTimeout(Exception):
+    """Raised when a recognition task does not finish within the request timeout."""
+
+
+def _init_worker():
+    # Load the dlib models once per worker instead of on the first frame
+    face_recog.face_recognition.face_locations(np.zeros((32, 32, 3), dtype=np.uint8))
+
+
+def recognize_frame(buffer, class_id, roster_version, options, tracker=None):
+    """
+    Worker entry point: decode a JPEG, run recognition against the worker's warm
+    copy of the class gallery and return (results, tracker, stats).
+    The tracker travels with the task because session state lives in the parent.
+    stats["timings"] holds the wall time of every stage run in the worker.
+    """
+    started = time.perf_counter()
+    timer = StageTimer()
+
+    with timer.stage("decode"):
+        frame = cv2.imdecode(np.frombuffer(buffer, np.uint8), cv2.IMREAD_COLOR)
+    if frame is None:
+        raise ValueError("Invalid image data")
+
+    with timer.stage("gallery"):
+        face_recog.sync_roster_version(roster_version)
+        if options.get("mode") == "global":
+            face_recog.sync_global_index(options["global_index"])
+            gallery = face_recog.ClassGallery(None, None, None)
+        else:
+            gallery = face_recog.get_class_gallery(class_id)
+
+    stats = {}
+    results = face_recog.process_frame(frame, gallery.encodings, gallery.student_ids, gallery.student_names,
+                                       tolerance=options.get("tolerance", face_recog.DEFAULT_TOLERANCE),
+                                       mode=options.get("mode", "class"),
+                                       n_probe=options.get("n_probe"),
+                                       detection=options.get("detection", face_recog.DEFAULT_DETECTION),
+                                       tracker=tracker, stats=stats,
+                                       thresholds=gallery.thresholds, references=gallery.references,
+                                       reference_owners=gallery.reference_owners)
+    timer.update(stats["timings"])
+    stats["timings"] = timer.stages
+    stats["worker_seconds"] = time.perf_counter() - started
+    return results, tracker, stats
+
+
+def recognize_batch(buffers, class_id, roster_version, options):
+    """Worker entry point for a burst of JPEG frames of one class (gallery loaded once)."""
+    started = time.perf_counter()
+    face_recog.sync_roster_version(roster_version)
+
+    frames = []
+    for buffer in buffers:
+        frame = cv2.imdecode(np.frombuffer(buffer, np.uint8), cv2.IMREAD_COLOR)
+        if frame is None:
+            raise ValueError("Invalid image data")
+        frames.append(frame)
+
+    gallery = face_recog.get_class_gallery(class_id)
+    frame_results, presence = face_recog.process_frames(
+        frames, gallery.encodings, gallery.student_ids, gallery.student_names,
+        tolerance=options.get("tolerance", face_recog.DEFAULT_TOLERANCE),
+        detection=options.get("detection", face_recog.DEFAULT_DETECTION),
+        min_frames=options.get("min_frames", 1),
+        thresholds=gallery.thresholds, references=gallery.references,
+        reference_owners=gallery.reference_owners)
+    return frame_results, presence, {"worker_seconds": time.perf_counter() - started}
+
+
+# Weight of the newest task in the pool's moving average latency
+LATENCY_SMOOTHING = 0.2
+
+
+class RecognitionPool:
+    """
+    Runs CPU-bound recognition in worker processes so throughput scales with cores
+    rather than with Flask request threads.
+
+    At most max_pending tasks may be queued or running; beyond that run() raises
+    PoolBusy instead of letting requests pile up. workers=0 runs tasks inline in
+    the calling thread (useful for development and debugging).
+    """
+
+    def __init__(self, workers, max_pending=None, timeout=5.0):
+        self.workers = max(0, int(workers))
+        self.max_pending = max_pending or max(1, self.workers * 2)
+        self.timeout = timeout
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self._started_at = time.monotonic()
+        self._last_change = self._started_at
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.restarts = 0
+        self.in_flight = 0
+        self.busy_seconds = 0.0
+        self.total_latency = 0.0
+        self.recent_latency = None
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn: forking a threaded web server can copy held locks into the child
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context("spawn"),
+                                                     initializer=_init_worker)
+            return self._executor
+
+    def _replace_executor(self, executor):
+        # A crashed worker (e.g. killed for memory) breaks the whole executor; drop it so
+        # the next task starts a fresh one. Only the first caller to notice replaces it.
+        with self._lock:
+            if self._executor is not executor:
+                return
+            self._executor = None
+            self.restarts += 1
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def run(self, fn, *args, timeout=None):
+        """Runs fn(*args) on a worker and waits for the result."""
+        return self.run_many(fn, [args], timeout=timeout)[0]
+
+    def run_many(self, fn, arg_lists, timeout=None):
+        """
+        Runs fn(*args) for every entry of arg_lists in parallel and returns the results
+        in order. Slots for all tasks are reserved up front, so either the whole batch
+        runs or PoolBusy is raised; timeout applies to the batch as a whole.
+        """
+        reserved = 0
+        while reserved < len(arg_lists) and self._slots.acquire(blocking=False):
+            reserved += 1
+        if reserved < len(arg_lists):
+            for _ in range(reserved):
+                self._slots.release()
+            with self._lock:
+                self.rejected += 1
+            raise PoolBusy()
+
+        with self._lock:
+            self._accumulate_busy()
+            self.submitted += len(arg_lists)
+            self.in_flight += len(arg_lists)
+        started = time.perf_counter()
+
+        if self.workers == 0:
+            results = []
+            for i, args in enumerate(arg_lists):
+                try:
+                    results.append(fn(*args))
+                except Exception:
+                    # The failed task and the ones that will not run
+                    for _ in arg_lists[i:]:
+                        self._finish(started, failed=True)
+                    raise
+                self._finish(started)
+            return results
+
+        executor = self._get_executor()
+        futures = []
+        for i, args in enumerate(arg_lists):
+            try:
+                future = executor.submit(fn, *args)
+            except Exception as e:
+                for _ in arg_lists[i:]:
+                    self._finish(started, failed=True)
+                if isinstance(e, BrokenProcessPool):
+                    self._replace_executor(executor)
+                    raise PoolRestarting() from e
+                raise
+            # The slot is released when the task really ends, even if the caller gave up waiting
+            future.add_done_callback(lambda f: self._finish(started, failed=f.cancelled() or f.exception() is not None))
+            futures.append(future)
+
+        deadline = time.monotonic() + (timeout or self.timeout)
+        try:
+            return [future.result(timeout=max(0.0, deadline - time.monotonic())) for future in futures]
+        except FutureTimeout:
+            with self._lock:
+                self.timeouts += 1
+            # Tasks still queued behind the batch are dropped; running ones finish in the background
+            for future in futures:
+                future.cancel()
+            raise PoolTimeout()
+        except BrokenProcessPool as e:
+            self._replace_executor(executor)
+            raise PoolRestarting() from e
+
+    def _finish(self, started, failed=False):
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self._accumulate_busy()
+            self.in_flight -= 1
+            if failed:
+                self.failed += 1
+            else:
+                self.completed += 1
+            self.total_latency += elapsed
+            if self.recent_latency is None:
+                self.recent_latency = elapsed
+            else:
+                self.recent_latency += LATENCY_SMOOTHING * (elapsed - self.recent_latency)
+        self._slots.release()
+
+    def _accumulate_busy(self):
+        # Integrates the number of busy workers over time (caller holds the lock)
+        now = time.monotonic()
+        self.busy_seconds += min(self.in_flight, max(1, self.workers)) * (now - self._last_change)
+        self._last_change = now
+
+    def load(self):
+        """(in_flight, workers, max_pending, recent latency in ms) for client pacing."""
+        with self._lock:
+            latency_ms = self.recent_latency * 1000 if self.recent_latency is not None else None
+            return self.in_flight, max(1, self.workers), self.max_pending, latency_ms
+
+    def stats(self):
+        with self._lock:
+            self._accumulate_busy()
+            uptime = time.monotonic() - self._started_at
+            finished = self.completed + self.failed
+            capacity = uptime * max(1, self.workers)
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "in_flight": self.in_flight,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "timeouts": self.timeouts,
+                "restarts": self.restarts,
+                "avg_latency_ms": round(self.total_latency / finished * 1000, 2) if finished else None,
+                "recent_latency_ms": round(self.recent_latency * 1000, 2) if self.recent_latency is not None else None,
+                "utilization": round(min(1.0, self.busy_seconds / capacity), 4) if capacity else 0.0
+            }
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
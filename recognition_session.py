@@ -0,0 +1,168 @@
+import threading
+import time
+from face_recog import get_class_gallery, get_class_detection_settings, roster_version
+from recognition_pool import recognize_frame
+from utils.face_tracker import FaceTracker
+from utils.attendance_aggregator import AttendanceAggregator, DEFAULT_MIN_HITS, DEFAULT_HIT_WINDOW
+from utils.motion_gate import MotionGate
+from utils.timing import StageTimer
+
+# Sessions with no frames for this long are dropped from the registry
+SESSION_IDLE_TIMEOUT = 15 * 60
+
+# Motion gate defaults: skip frames where under 1% of the scene changed, but
+# still run full recognition at least every 2 seconds. threshold=0 disables it.
+MOTION_GATE_THRESHOLD = 0.01
+MOTION_GATE_REFRESH = 2.0
+
+
+class RecognitionSession:
+    """
+    Server-side state for one live recognition session, bound to
+    (class_id, subject, hour, date). Frames run on the recognition pool, whose
+    workers keep their own warm copy of the class gallery.
+    Presence is decided here too: every frame's matches are fed to the session's
+    AttendanceAggregator, and submitting the session just finalizes it.
+    With a motion gate, frames that barely differ from the last processed one
+    return the previous results without running detection.
+    """
+
+    def __init__(self, class_id, subject, hour, date, pool, min_hits=DEFAULT_MIN_HITS,
+                 hit_window=DEFAULT_HIT_WINDOW, motion_threshold=MOTION_GATE_THRESHOLD,
+                 motion_refresh=MOTION_GATE_REFRESH):
+        self.class_id = int(class_id)
+        self.subject = subject
+        self.hour = hour
+        self.date = date
+        self.key = (self.class_id, subject, str(hour), date)
+        self.detection = get_class_detection_settings(self.class_id)
+        self.tracker = FaceTracker()
+        self.attendance = AttendanceAggregator(self.class_id, subject, hour, date, min_hits, hit_window)
+        self.motion_gate = MotionGate(motion_threshold, motion_refresh) if motion_threshold else None
+        self.last_results = []
+        self.pool = pool
+        self.frames = 0
+        self.faces_detected = 0
+        self.faces_filtered = 0
+        self.faces_encoded = 0
+        self.created_at = time.monotonic()
+        self.last_active = self.created_at
+        # One session can be fed from several connections (e.g. a reconnecting browser)
+        self.lock = threading.Lock()
+
+    def reload_gallery(self):
+        with self.lock:
+            self.detection = get_class_detection_settings(self.class_id)
+            # Identities held by tracks may refer to students that were just removed
+            self.tracker.reset()
+            if self.motion_gate:
+                self.motion_gate.reset()
+
+    def process(self, buffer, timer=None):
+        """
+        Runs recognition for one JPEG frame of this session.
+        Frames of one session run one at a time because they share the tracker.
+        If a StageTimer is given it receives the time of every stage, including
+        the wait for a worker ("queue").
+        """
+        timer = timer if timer is not None else StageTimer()
+        with self.lock:
+            self.frames += 1
+            self.last_active = time.monotonic()
+            if self.motion_gate:
+                with timer.stage("motion_gate"):
+                    changed = self.motion_gate.should_process(buffer)
+                if not changed:
+                    # Skipped frames are not counted as votes; the cached results keep their flags
+                    return [dict(result) for result in self.last_results]
+
+            options = {"detection": self.detection}
+            started = time.perf_counter()
+            try:
+                results, self.tracker, frame_stats = self.pool.run(
+                    recognize_frame, buffer, self.class_id, roster_version(), options, self.tracker)
+            except Exception:
+                if self.motion_gate:
+                    self.motion_gate.reset()
+                raise
+            timer.update(frame_stats["timings"])
+            timer.add("queue", time.perf_counter() - started - frame_stats["worker_seconds"])
+            self.faces_detected += frame_stats["detected"]
+            self.faces_filtered += frame_stats["filtered"]
+            self.faces_encoded += frame_stats["encoded"]
+            with timer.stage("vote"):
+                self.last_results = self.attendance.record(results)
+            return self.last_results
+
+    def stats(self):
+        return {
+            "class_id": self.class_id,
+            "subject": self.subject,
+            "hour": self.hour,
+            "date": self.date,
+            "frames": self.frames,
+            "faces_detected": self.faces_detected,
+            "faces_filtered": self.faces_filtered,
+            "faces_encoded": self.faces_encoded,
+            "students": len(get_class_gallery(self.class_id).student_ids),
+            "attendance": self.attendance.stats(),
+            "motion_gate": self.motion_gate.stats() if self.motion_gate else None
+        }
+
+
+class SessionRegistry:
+    """Keeps the open recognition sessions of this process, keyed by (class_id, subject, hour, date)."""
+
+    def __init__(self, pool, idle_timeout=SESSION_IDLE_TIMEOUT, min_hits=DEFAULT_MIN_HITS,
+                 hit_window=DEFAULT_HIT_WINDOW, motion_threshold=MOTION_GATE_THRESHOLD,
+                 motion_refresh=MOTION_GATE_REFRESH):
+        self.pool = pool
+        self.idle_timeout = idle_timeout
+        self.min_hits = min_hits
+        self.hit_window = hit_window
+        self.motion_threshold = motion_threshold
+        self.motion_refresh = motion_refresh
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def open(self, class_id, subject, hour, date, motion_gate=True):
+        """
+        Returns the session for this key, creating it if needed.
+        motion_gate=False turns frame skipping off for a newly created session.
+        """
+        key = (int(class_id), subject, str(hour), date)
+        with self._lock:
+            self._expire_idle()
+            session = self._sessions.get(key)
+            if session is None:
+                session = RecognitionSession(class_id, subject, hour, date, self.pool,
+                                             self.min_hits, self.hit_window,
+                                             self.motion_threshold if motion_gate else 0,
+                                             self.motion_refresh)
+                self._sessions[key] = session
+            return session
+
+    def get(self, class_id, subject, hour, date):
+        with self._lock:
+            return self._sessions.get((int(class_id), subject, str(hour), date))
+
+    def close(self, class_id, subject, hour, date):
+        with self._lock:
+            return self._sessions.pop((int(class_id), subject, str(hour), date), None)
+
+    def reload_class(self, class_id):
+        """Points open sessions of a class at its freshly loaded roster."""
+        with self._lock:
+            sessions = [s for s in self._sessions.values() if s.class_id == int(class_id)]
+        for session in sessions:
+            session.reload_gallery()
+
+    def _expire_idle(self):
+        now = time.monotonic()
+        for key, session in list(self._sessions.items()):
+            if now - session.last_active > self.idle_timeout:
+                del self._sessions[key]
+
+    def sessions(self):
+        with self._lock:
+            return list(self._sessions.values())
@@ -0,0 +1,109 @@
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+# Add the repository root to the path to import the app modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from migrations import HOT_QUERIES, MIGRATIONS, apply_migrations, explain_query_plan, full_scans, schema_version
+from utils.attendance_writer import write_attendance
+from utils.hashing import calculate_hash, find_chain_break
+
+
+class MigrationTest(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        self.conn = sqlite3.connect(self.path)
+
+    def tearDown(self):
+        self.conn.close()
+        os.remove(self.path)
+
+    def test_migrations_apply_once(self):
+        versions = [version for version, _, _ in MIGRATIONS]
+        self.assertEqual(apply_migrations(self.conn), versions)
+        self.assertEqual(apply_migrations(self.conn), [])
+        self.assertEqual(schema_version(self.conn.cursor()), versions[-1])
+
+    def test_migrations_upgrade_unversioned_database(self):
+        # A database created before versioning: attendance without the later columns
+        self.conn.execute("CREATE TABLE attendance (id INTEGER PRIMARY KEY AUTOINCREMENT, student_id INTEGER, "
+                          "subject TEXT, date TEXT, status TEXT)")
+        self.conn.commit()
+        apply_migrations(self.conn)
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(attendance)")}
+        self.assertTrue({"hour", "previous_hash", "current_hash"} <= columns)
+
+    def test_hot_queries_use_indexes(self):
+        apply_migrations(self.conn)
+        c = self.conn.cursor()
+        for name, query, params in HOT_QUERIES:
+            with self.subTest(name):
+                self.assertEqual(full_scans(explain_query_plan(c, query, params)), [])
+
+    def test_write_attendance_uses_indexes(self):
+        apply_migrations(self.conn)
+        c = self.conn.cursor()
+        c.executemany("INSERT INTO students (usn, name, class_id) VALUES (?,?,?)",
+                      [(f"USN{i}", f"Student {i}", 1 + i % 2) for i in range(10)])
+        self.conn.commit()
+
+        statements = []
+        self.conn.set_trace_callback(statements.append)
+        write_attendance(c, 1, "Maths", "2024-01-01", 1, [1, 3])
+        self.conn.commit()
+        write_attendance(c, 1, "Maths", "2024-01-01", 1, [5])
+        self.conn.commit()
+        self.conn.set_trace_callback(None)
+
+        selects = {s for s in statements if s.lstrip().upper().startswith("SELECT")}
+        # The chain tail is read from the end of the rowid b-tree, one row regardless of table size
+        selects = {s for s in selects if "ORDER BY id DESC LIMIT 1" not in s}
+        self.assertTrue(selects)
+        for statement in selects:
+            with self.subTest(statement):
+                self.assertEqual(full_scans(explain_query_plan(c, statement)), [])
+
+        c.execute("SELECT student_id, status FROM attendance ORDER BY student_id")
+        self.assertEqual(c.fetchall(), [(1, "Absent"), (3, "Absent"), (5, "Present"), (7, "Absent"), (9, "Absent")])
+
+    def _database_with_duplicates(self):
+        # A database from before migration 3, with two rows for the same lecture in its chain
+        c = self.conn.cursor()
+        for version, _, migrate in MIGRATIONS:
+            if version < 3:
+                migrate(c)
+        previous_hash = "0" * 64
+        for student_id, status in [(1, "Absent"), (2, "Present"), (1, "Present"), (3, "Absent")]:
+            current_hash = calculate_hash(student_id, "Maths", "2024-01-01", status, 1, previous_hash)
+            c.execute("INSERT INTO attendance (student_id, subject, date, status, hour, previous_hash, current_hash) "
+                      "VALUES (?,?,?,?,?,?,?)", (student_id, "Maths", "2024-01-01", status, 1, previous_hash, current_hash))
+            previous_hash = current_hash
+        self.conn.commit()
+        return c
+
+    def test_duplicate_removal_relinks_intact_chain(self):
+        c = self._database_with_duplicates()
+        apply_migrations(self.conn)
+        c.execute("SELECT student_id, status FROM attendance ORDER BY id")
+        self.assertEqual(c.fetchall(), [(2, "Present"), (1, "Present"), (3, "Absent")])
+        c.execute("SELECT id, kept_id FROM attendance_duplicates")
+        self.assertEqual(c.fetchall(), [(1, 3)])
+        self.assertIsNone(find_chain_break(c))
+
+    def test_duplicate_removal_keeps_tampering_visible(self):
+        c = self._database_with_duplicates()
+        c.execute("UPDATE attendance SET status='Present' WHERE id=4")
+        self.conn.commit()
+        apply_migrations(self.conn)
+        c.execute("SELECT COUNT(*) FROM attendance_duplicates")
+        self.assertEqual(c.fetchone()[0], 1)
+        self.assertIsNotNone(find_chain_break(c))
+
+
+if __name__ == "__main__":
+    unittest.main()
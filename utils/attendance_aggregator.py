@@ -0,0 +1,186 @@
+import datetime
+import threading
+import time
+from collections import deque
+from utils.attendance_writer import write_attendance
+from database import get_connection
+
+# A student is confirmed present after MIN_HITS matched frames within HIT_WINDOW seconds
+DEFAULT_MIN_HITS = 3
+DEFAULT_HIT_WINDOW = 10.0
+# Hit counts of students not yet confirmed are written at most this often
+PERSIST_INTERVAL = 5.0
+
+
+class StudentVotes:
+    def __init__(self, student_id, confirmed=False, hits=0, best_distance=None):
+        self.student_id = student_id
+        self.confirmed = confirmed
+        self.hits = hits
+        self.best_distance = best_distance
+        self.recent = deque()
+        self.dirty = False
+
+
+def find_session(class_id, subject, hour, date):
+    """Returns the id of a persisted attendance session, or None if none was ever opened."""
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("SELECT id FROM attendance_sessions WHERE class_id=? AND subject=? AND hour=? AND date=?",
+              (int(class_id), subject, str(hour), date))
+    row = c.fetchone()
+    conn.close()
+    return row[0] if row else None
+
+
+class AttendanceAggregator:
+    """
+    Decides presence on the server for one (class_id, subject, hour, date) session.
+
+    Every recognized face is a vote for that student. A student is confirmed once
+    min_hits votes fall within hit_window seconds, so a single false-positive frame
+    does not mark anyone present. Votes are persisted in attendance_sightings as
+    they come in, and finalize() writes the attendance rows from the confirmed set.
+    """
+
+    def __init__(self, class_id, subject, hour, date, min_hits=DEFAULT_MIN_HITS, hit_window=DEFAULT_HIT_WINDOW):
+        self.class_id = int(class_id)
+        self.subject = subject
+        self.hour = str(hour)
+        self.date = date
+        self.min_hits = min_hits
+        self.hit_window = hit_window
+        self.students = {}
+        self._last_persist = time.monotonic()
+        self._lock = threading.Lock()
+
+        conn = get_connection()
+        c = conn.cursor()
+        c.execute("""INSERT OR IGNORE INTO attendance_sessions (class_id, subject, hour, date, status, created_at)
+                     VALUES (?,?,?,?, 'open', ?)""",
+                  (self.class_id, subject, self.hour, date, _timestamp()))
+        c.execute("SELECT id, status FROM attendance_sessions WHERE class_id=? AND subject=? AND hour=? AND date=?",
+                  (self.class_id, subject, self.hour, date))
+        self.session_id, self.status = c.fetchone()
+
+        # Resume votes from an earlier run of this session (e.g. after a restart)
+        c.execute("SELECT student_id, hits, best_distance, confirmed FROM attendance_sightings WHERE session_id=?",
+                  (self.session_id,))
+        for student_id, hits, best_distance, confirmed in c.fetchall():
+            self.students[student_id] = StudentVotes(student_id, bool(confirmed), hits, best_distance)
+
+        # Students already marked present for this hour stay present, as on the live page
+        c.execute("""SELECT attendance.student_id FROM attendance
+                     JOIN students ON attendance.student_id = students.id
+                     WHERE students.class_id=? AND attendance.subject=? AND attendance.date=?
+                     AND attendance.hour=? AND attendance.status='Present'""",
+                  (self.class_id, subject, date, self.hour))
+        for (student_id,) in c.fetchall():
+            self.students.setdefault(student_id, StudentVotes(student_id)).confirmed = True
+
+        conn.commit()
+        conn.close()
+
+    def record(self, results, min_hits=None):
+        """
+        Counts the faces of one frame and sets results[i]["confirmed"].
+        Newly confirmed students are persisted immediately.
+        min_hits overrides the session's vote threshold for this frame
+        (e.g. 1 for a still photo, which is not followed by more frames).
+        """
+        min_hits = self.min_hits if min_hits is None else min_hits
+        now = time.monotonic()
+        newly_confirmed = False
+        with self._lock:
+            for result in results:
+                student_id = result.get("student_id")
+                if student_id is None:
+                    result["confirmed"] = False
+                    continue
+
+                votes = self.students.get(student_id)
+                if votes is None:
+                    votes = self.students[student_id] = StudentVotes(student_id)
+                votes.hits += 1
+                votes.dirty = True
+                if result.get("distance") is not None and (votes.best_distance is None
+                                                           or result["distance"] < votes.best_distance):
+                    votes.best_distance = result["distance"]
+
+                votes.recent.append(now)
+                while votes.recent and votes.recent[0] < now - self.hit_window:
+                    votes.recent.popleft()
+                if not votes.confirmed and len(votes.recent) >= min_hits:
+                    votes.confirmed = True
+                    newly_confirmed = True
+                result["confirmed"] = votes.confirmed
+
+            if newly_confirmed or now - self._last_persist >= PERSIST_INTERVAL:
+                self._persist(reopen=newly_confirmed)
+        return results
+
+    def _persist(self, reopen=False):
+        # Caller holds the lock
+        dirty = [v for v in self.students.values() if v.dirty]
+        self._last_persist = time.monotonic()
+        if not dirty and not reopen:
+            return
+
+        seen_at = _timestamp()
+        conn = get_connection()
+        c = conn.cursor()
+        c.executemany("""INSERT INTO attendance_sightings (session_id, student_id, hits, best_distance, confirmed, last_seen)
+                         VALUES (?,?,?,?,?,?)
+                         ON CONFLICT(session_id, student_id) DO UPDATE SET
+                             hits=excluded.hits, best_distance=excluded.best_distance,
+                             confirmed=excluded.confirmed, last_seen=excluded.last_seen""",
+                      [(self.session_id, v.student_id, v.hits, v.best_distance, int(v.confirmed), seen_at)
+                       for v in dirty])
+        if reopen and self.status == "finalized":
+            # A student confirmed after submit means the stored attendance is out of date
+            self.status = "open"
+            c.execute("UPDATE attendance_sessions SET status='open' WHERE id=?", (self.session_id,))
+        conn.commit()
+        conn.close()
+        for votes in dirty:
+            votes.dirty = False
+
+    def confirmed_ids(self):
+        with self._lock:
+            return {v.student_id for v in self.students.values() if v.confirmed}
+
+    def finalize(self):
+        """
+        Writes Present/Absent rows for the whole class from the confirmed set.
+        Finalizing again without new confirmations does not touch the attendance table.
+        Returns (present, absent) counts, or None if nothing had to be written.
+        """
+        with self._lock:
+            self._persist()
+            if self.status == "finalized":
+                return None
+            present_ids = {v.student_id for v in self.students.values() if v.confirmed}
+
+            conn = get_connection()
+            c = conn.cursor()
+            counts = write_attendance(c, self.class_id, self.subject, self.date, self.hour, present_ids)
+            c.execute("UPDATE attendance_sessions SET status='finalized', finalized_at=? WHERE id=?",
+                      (_timestamp(), self.session_id))
+            conn.commit()
+            conn.close()
+            self.status = "finalized"
+            return counts
+
+    def stats(self):
+        with self._lock:
+            return {
+                "status": self.status,
+                "seen": len(self.students),
+                "confirmed": sum(1 for v in self.students.values() if v.confirmed),
+                "min_hits": self.min_hits,
+                "hit_window": self.hit_window
+            }
+
+
+def _timestamp():
+    return datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -0,0 +1,52 @@
+from utils.hashing import calculate_hash, get_last_hash
+
+def write_attendance(c, class_id, subject, date, hour, present_student_ids):
+    """
+    Marks every student of a class Present or Absent for one (subject, date, hour).
+    New rows are appended to the hash chain; existing rows only get their status updated.
+    Runs on the caller's cursor, the caller commits. Returns (present, absent) counts.
+    """
+    # Take the write lock before reading, so the chain tail and the existing rows cannot
+    # change under us when several classes submit at the same time
+    if not c.connection.in_transaction:
+        c.execute("BEGIN IMMEDIATE")
+
+    # Get all students in class to mark absent ones
+    c.execute("SELECT id FROM students WHERE class_id=?", (class_id,))
+    all_students = [row[0] for row in c.fetchall()]
+
+    # Students of the class already marked for this subject/date/hour
+    c.execute("""SELECT student_id FROM attendance
+                 WHERE subject=? AND date=? AND hour=?
+                 AND student_id IN (SELECT id FROM students WHERE class_id=?)""",
+              (subject, date, hour, class_id))
+    existing = {row[0] for row in c.fetchall()}
+
+    # Get the last hash to start the chain for this batch
+    previous_hash = get_last_hash(c)
+
+    present_ids = set(present_student_ids)
+    present = 0
+    rows = []
+    for sid in all_students:
+        status = "Present" if sid in present_ids else "Absent"
+        if status == "Present":
+            present += 1
+
+        if sid in existing:
+            # Existing rows only get their status updated (the hash columns of the row are
+            # ignored on conflict). The stored hash no longer matches, which verify_integrity
+            # reports as intended for tamper detection; the chain itself is left untouched.
+            rows.append((sid, subject, date, status, hour, None, None))
+        else:
+            # New rows are inserted in this order, so each one links to the previous new row
+            current_hash = calculate_hash(sid, subject, date, status, hour, previous_hash)
+            rows.append((sid, subject, date, status, hour, previous_hash, current_hash))
+            previous_hash = current_hash
+
+    c.executemany("""INSERT INTO attendance (student_id, subject, date, status, hour, previous_hash, current_hash)
+                     VALUES (?,?,?,?,?,?,?)
+                     ON CONFLICT(student_id, subject, date, hour) DO UPDATE SET status=excluded.status""",
+                  rows)
+
+    return present, len(all_students) - present
@@ -0,0 +1,61 @@
+import threading
+from collections import OrderedDict
+
+
+class EncodingCache:
+    """
+    Bounded LRU cache of per-class face galleries, keyed by class_id.
+    The least recently used class is evicted once max_classes is exceeded.
+    """
+
+    def __init__(self, max_classes=64):
+        self.max_classes = max_classes
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, class_id, loader):
+        """
+        Returns the cached gallery for class_id, calling loader(class_id) on a miss.
+        The loader runs outside the lock so one slow class does not block the others.
+        """
+        with self._lock:
+            if class_id in self._entries:
+                self._entries.move_to_end(class_id)
+                self.hits += 1
+                return self._entries[class_id]
+            self.misses += 1
+            generation = (self._epoch, self._generations.get(class_id, 0))
+
+        gallery = loader(class_id)
+
+        with self._lock:
+            # Only store the result if the roster was not invalidated while we were loading
+            if (self._epoch, self._generations.get(class_id, 0)) == generation:
+                self._entries[class_id] = gallery
+                self._entries.move_to_end(class_id)
+                while len(self._entries) > self.max_classes:
+                    self._entries.popitem(last=False)
+        return gallery
+
+    def invalidate(self, class_id=None):
+        """Drops one class from the cache, or every class if class_id is None."""
+        with self._lock:
+            if class_id is None:
+                self._epoch += 1
+                self._entries.clear()
+            else:
+                self._generations[class_id] = self._generations.get(class_id, 0) + 1
+                self._entries.pop(class_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "classes": len(self._entries),
+                "max_classes": self.max_classes,
+                "hits": self.hits,
+                "misses": self.misses
+            }
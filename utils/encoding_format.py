@@ -0,0 +1,59 @@
+import struct
+import numpy as np
+
+# Binary face-encoding format stored in students.face_encoding:
+#   4s  magic "FENC"
+#   B   format version
+#   B   dtype code (1 = float32, 2 = float64)
+#   H   number of dimensions
+# followed by the little-endian values. Unlike pickle it is safe to load and a
+# whole class can be read with one np.frombuffer over the concatenated rows.
+MAGIC = b"FENC"
+VERSION = 1
+HEADER = struct.Struct("<4sBBH")
+
+_DTYPES = {1: np.dtype("<f4"), 2: np.dtype("<f8")}
+_CODES = {np.dtype("<f4"): 1, np.dtype("<f8"): 2}
+
+
+def pack_encoding(encoding, dtype=np.float64):
+    """Serializes one encoding. float64 keeps dlib's output bit-for-bit."""
+    dtype = np.dtype(dtype).newbyteorder("<")
+    values = np.ascontiguousarray(encoding, dtype=dtype).ravel()
+    return HEADER.pack(MAGIC, VERSION, _CODES[dtype], values.size) + values.tobytes()
+
+
+def is_packed(blob):
+    return blob is not None and bytes(blob[:4]) == MAGIC
+
+
+def _read_header(blob):
+    magic, version, code, dim = HEADER.unpack_from(blob)
+    if magic != MAGIC or version != VERSION or code not in _DTYPES:
+        raise ValueError("Unsupported face encoding format")
+    return _DTYPES[code], dim
+
+
+def unpack_encoding(blob):
+    dtype, dim = _read_header(blob)
+    return np.frombuffer(blob, dtype=dtype, count=dim, offset=HEADER.size)
+
+
+def stack_encodings(blobs, dim=128):
+    """
+    Builds an (N x D) float64 matrix from packed rows. Rows sharing the same header
+    are concatenated and parsed with a single np.frombuffer call.
+    """
+    if not blobs:
+        return np.empty((0, dim), dtype=np.float64)
+
+    header = bytes(blobs[0][:HEADER.size])
+    dtype, dim = _read_header(header)
+    if all(bytes(blob[:HEADER.size]) == header for blob in blobs):
+        row_bytes = dtype.itemsize * dim
+        payload = b"".join(memoryview(blob)[HEADER.size:HEADER.size + row_bytes] for blob in blobs)
+        matrix = np.frombuffer(payload, dtype=dtype).reshape(len(blobs), dim)
+        return matrix.astype(np.float64, copy=False)
+
+    # Mixed precisions: fall back to one row at a time
+    return np.vstack([unpack_encoding(blob).astype(np.float64) for blob in blobs])
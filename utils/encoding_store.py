@@ -0,0 +1,180 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import numpy as np
+from utils.encoding_format import stack_encodings
+
+# Number of generation directories kept on disk. Older ones are removed on rebuild;
+# on POSIX a worker that still maps one keeps its pages until it remaps.
+KEEP_GENERATIONS = 2
+
+
+class EncodingStore:
+    """
+    On-disk copy of every face encoding, shared by all processes of a deployment.
+
+    Each generation is a directory holding encodings.npy (one contiguous float32
+    matrix of per-student centroids, rows grouped by class), references.npy (the
+    per-student reference encodings, grouped the same way) and index.json (offsets,
+    counts, ids, names and thresholds per class). The CURRENT file names the live generation and is swapped atomically,
+    so readers either see the old or the new store, never a half-written one.
+    Readers map the matrix with np.load(mmap_mode='r'), so every worker shares
+    the same physical pages instead of holding its own copy of each gallery.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._generation = None
+        self._matrix = None
+        self._references = None
+        self._index = {}
+        self._disabled = False
+        self._lock = threading.Lock()
+
+    def build(self, rows, reference_rows=(), dim=128, source=None):
+        """
+        Writes a new generation and makes it current. Returns the generation name.
+        rows are (class_id, student_id, name, encoding_blob, threshold) and
+        reference_rows are (student_id, encoding_blob) ordered by student.
+        source identifies the data the generation was built from (see current_source).
+        """
+        by_class = {}
+        for class_id, student_id, name, blob, threshold in rows:
+            by_class.setdefault(int(class_id), []).append((student_id, name, blob, threshold))
+        references_by_student = {}
+        for student_id, blob in reference_rows:
+            references_by_student.setdefault(student_id, []).append(blob)
+
+        blobs = []
+        reference_blobs = []
+        index = {}
+        for class_id, students in sorted(by_class.items()):
+            entry = {
+                "offset": len(blobs),
+                "count": len(students),
+                "student_ids": [s[0] for s in students],
+                "student_names": [s[1] for s in students],
+                "thresholds": [s[3] for s in students],
+                "ref_offset": len(reference_blobs),
+                "ref_owners": []
+            }
+            for column, student in enumerate(students):
+                student_references = references_by_student.get(student[0], [])
+                entry["ref_owners"].extend([column] * len(student_references))
+                reference_blobs.extend(student_references)
+            index[str(class_id)] = entry
+            blobs.extend(s[2] for s in students)
+        matrix = stack_encodings(blobs, dim).astype(np.float32)
+        references = stack_encodings(reference_blobs, dim).astype(np.float32)
+
+        os.makedirs(self.root, exist_ok=True)
+        # mkdtemp gives a unique name even if two processes rebuild at the same time
+        gen_dir = tempfile.mkdtemp(prefix="gen-", dir=self.root)
+        np.save(os.path.join(gen_dir, "encodings.npy"), matrix)
+        np.save(os.path.join(gen_dir, "references.npy"), references)
+        with open(os.path.join(gen_dir, "index.json"), "w") as f:
+            json.dump(index, f)
+        if source is not None:
+            with open(os.path.join(gen_dir, "SOURCE"), "w") as f:
+                f.write(source)
+
+        generation = os.path.basename(gen_dir)
+        tmp_path = os.path.join(self.root, f"CURRENT.{generation}")
+        with open(tmp_path, "w") as f:
+            f.write(generation)
+        os.replace(tmp_path, os.path.join(self.root, "CURRENT"))
+
+        self._remove_old_generations(generation)
+        return generation
+
+    def _remove_old_generations(self, current):
+        # Another process may have published a newer generation in the meantime
+        live = {current, self.current_generation()}
+        generations = [name for name in os.listdir(self.root)
+                       if name.startswith("gen-") and name not in live]
+        generations.sort(key=lambda name: os.path.getmtime(os.path.join(self.root, name)), reverse=True)
+        for name in generations[KEEP_GENERATIONS - 1:]:
+            shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+
+    def current_generation(self):
+        """Reads the CURRENT pointer; None if the store has never been built."""
+        try:
+            with open(os.path.join(self.root, "CURRENT")) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def current_source(self):
+        """The source given when the current generation was built; None if unknown."""
+        generation = self.current_generation()
+        if generation is None:
+            return None
+        try:
+            with open(os.path.join(self.root, generation, "SOURCE")) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def refresh(self):
+        """
+        Remaps the store if another process published a new generation.
+        Returns True when the mapping changed.
+        """
+        generation = None if self._disabled else self.current_generation()
+        with self._lock:
+            if generation == self._generation:
+                return False
+            if generation is None:
+                self._matrix, self._references, self._index = None, None, {}
+            else:
+                gen_dir = os.path.join(self.root, generation)
+                try:
+                    with open(os.path.join(gen_dir, "index.json")) as f:
+                        index = json.load(f)
+                    # Empty arrays cannot be mapped, so those are never opened
+                    matrix = np.load(os.path.join(gen_dir, "encodings.npy"), mmap_mode="r") if index else None
+                    has_references = any(entry["ref_owners"] for entry in index.values())
+                    references = None
+                    if has_references:
+                        references = np.load(os.path.join(gen_dir, "references.npy"), mmap_mode="r")
+                except FileNotFoundError:
+                    # Removed by a newer rebuild between reading CURRENT and opening it
+                    return False
+                self._matrix, self._references, self._index = matrix, references, index
+            self._generation = generation
+            return True
+
+    def get_class(self, class_id):
+        """
+        Returns (matrix, student_ids, student_names, thresholds, references, reference_owners)
+        for a class, or None if the store has no such class. The matrices are read-only
+        views into the shared mapping; thresholds is None when no student has its own.
+        """
+        with self._lock:
+            entry = self._index.get(str(int(class_id)))
+            if entry is None or self._matrix is None:
+                return None
+            start = entry["offset"]
+            matrix = np.asarray(self._matrix[start:start + entry["count"]])
+
+            thresholds = None
+            if any(t is not None for t in entry["thresholds"]):
+                thresholds = np.array([np.nan if t is None else t for t in entry["thresholds"]])
+
+            references, owners = None, None
+            if entry["ref_owners"]:
+                ref_start = entry["ref_offset"]
+                references = np.asarray(self._references[ref_start:ref_start + len(entry["ref_owners"])])
+                owners = np.array(entry["ref_owners"])
+            return matrix, entry["student_ids"], entry["student_names"], thresholds, references, owners
+
+    def disable(self):
+        """Stops using the store in this process (e.g. the directory is not writable)."""
+        self._disabled = True
+        self.refresh()
+
+    @property
+    def generation(self):
+        return self._generation
@@ -0,0 +1,170 @@
+import threading
+import numpy as np
+from utils.face_matching import DEFAULT_TOLERANCE, assign_matches, distance_matrix
+
+
+def kmeans(vectors, n_clusters, iterations=10, seed=0):
+    """Plain Lloyd's k-means in NumPy. Returns the (n_clusters x D) centroid matrix."""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+
+    for _ in range(iterations):
+        labels = np.argmin(distance_matrix(vectors, centroids), axis=1)
+        counts = np.bincount(labels, minlength=n_clusters)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, vectors)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+        # Re-seed empty clusters with random points so no list stays unused
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            centroids[empty] = vectors[rng.choice(len(vectors), len(empty), replace=False)]
+
+    return centroids
+
+
+class FaceIndex:
+    """
+    Institution-wide IVF (inverted file) index over face encodings.
+
+    Vectors are partitioned by k-means into n_lists cells and a query only scans
+    the n_probe closest cells. More probes give better recall at higher latency.
+    Below train_threshold vectors the index simply does a brute-force scan.
+    """
+
+    def __init__(self, dim=128, n_lists=None, n_probe=8, train_threshold=1024, retrain_growth=2.0):
+        self.dim = dim
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.train_threshold = train_threshold
+        self.retrain_growth = retrain_growth
+
+        self._vectors = np.empty((0, dim), dtype=np.float64)
+        self._size = 0
+        self._student_ids = []
+        self._names = []
+        self._rows = {}  # student_id -> row
+        self._lists = np.empty(0, dtype=np.int64)  # cell of each row, -1 once removed
+        self._centroids = None
+        self._trained_size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def add(self, student_id, name, encoding):
+        """Adds (or replaces) one student. Cells are assigned incrementally once trained."""
+        with self._lock:
+            self._append(student_id, name, encoding)
+            if self._needs_training():
+                self._train()
+
+    def add_many(self, student_ids, names, encodings):
+        """Bulk version of add() that retrains at most once at the end."""
+        with self._lock:
+            for student_id, name, encoding in zip(student_ids, names, encodings):
+                self._append(student_id, name, encoding)
+            if self._needs_training():
+                self._train()
+
+    def _append(self, student_id, name, encoding):
+        vector = np.asarray(encoding, dtype=np.float64).reshape(self.dim)
+        if student_id in self._rows:
+            self._lists[self._rows.pop(student_id)] = -1
+
+        if self._size == len(self._vectors):
+            capacity = max(256, 2 * len(self._vectors))
+            self._vectors = np.resize(self._vectors, (capacity, self.dim))
+            self._lists = np.resize(self._lists, capacity)
+
+        row = self._size
+        self._vectors[row] = vector
+        self._lists[row] = self._nearest_cell(vector[None, :])[0] if self._centroids is not None else 0
+        self._student_ids.append(student_id)
+        self._names.append(name)
+        self._rows[student_id] = row
+        self._size += 1
+
+    def remove(self, student_id):
+        with self._lock:
+            row = self._rows.pop(student_id, None)
+            if row is not None:
+                self._lists[row] = -1
+
+    def train(self):
+        """Forces a k-means rebuild of the cells, e.g. after a large bulk import."""
+        with self._lock:
+            self._train()
+
+    def _needs_training(self):
+        live = len(self._rows)
+        if live < self.train_threshold:
+            return False
+        return self._centroids is None or live >= self._trained_size * self.retrain_growth
+
+    def _train(self):
+        live_rows = np.flatnonzero(self._lists[:self._size] >= 0)
+        if len(live_rows) < self.train_threshold:
+            self._centroids = None
+            self._lists[live_rows] = 0
+            return
+
+        n_lists = self.n_lists or int(4 * np.sqrt(len(live_rows)))
+        n_lists = max(1, min(n_lists, len(live_rows)))
+        # Training on a sample keeps rebuilds cheap for very large galleries
+        rng = np.random.default_rng(len(live_rows))
+        sample_rows = live_rows
+        if len(sample_rows) > 64 * n_lists:
+            sample_rows = rng.choice(live_rows, 64 * n_lists, replace=False)
+
+        self._centroids = kmeans(self._vectors[sample_rows], n_lists)
+        self._lists[live_rows] = self._nearest_cell(self._vectors[live_rows])
+        self._trained_size = len(live_rows)
+
+    def _nearest_cell(self, vectors):
+        return np.argmin(distance_matrix(vectors, self._centroids), axis=1)
+
+    def _candidate_rows(self, faces, n_probe):
+        lists = self._lists[:self._size]
+        if self._centroids is None:
+            return np.flatnonzero(lists >= 0)
+
+        n_probe = max(1, min(n_probe, len(self._centroids)))
+        cell_distances = distance_matrix(faces, self._centroids)
+        probed = np.argpartition(cell_distances, n_probe - 1, axis=1)[:, :n_probe]
+        return np.flatnonzero(np.isin(lists, np.unique(probed)))
+
+    def match(self, face_encodings, tolerance=DEFAULT_TOLERANCE, n_probe=None):
+        """
+        Matches all faces of a frame against the index.
+        Returns parallel lists of student ids, names and distances (None for unknown faces).
+        """
+        faces = np.asarray(face_encodings, dtype=np.float64).reshape(-1, self.dim)
+        with self._lock:
+            rows = self._candidate_rows(faces, n_probe or self.n_probe)
+            candidates = self._vectors[rows]
+            student_ids = [self._student_ids[row] for row in rows]
+            names = [self._names[row] for row in rows]
+
+        indices, distances = assign_matches(distance_matrix(faces, candidates), tolerance)
+
+        matched_ids, matched_names, matched_distances = [], [], []
+        for idx, distance in zip(indices, distances):
+            if idx >= 0:
+                matched_ids.append(student_ids[idx])
+                matched_names.append(names[idx])
+                matched_distances.append(float(distance))
+            else:
+                matched_ids.append(None)
+                matched_names.append(None)
+                matched_distances.append(None)
+        return matched_ids, matched_names, matched_distances
+
+    def stats(self):
+        with self._lock:
+            return {
+                "students": len(self._rows),
+                "trained": self._centroids is not None,
+                "lists": 0 if self._centroids is None else len(self._centroids),
+                "n_probe": self.n_probe
+            }
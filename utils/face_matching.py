@@ -0,0 +1,158 @@
+import numpy as np
+
+DEFAULT_TOLERANCE = 0.6
+# Upper bound on stored reference encodings per student, keeps the gallery bounded
+MAX_REFERENCE_ENCODINGS = 5
+# Faces whose distance to a student's centroid is this close above the threshold are
+# re-checked against that student's individual reference encodings
+REFERENCE_MARGIN = 0.08
+
+
+def distance_matrix(face_encodings, known_encodings):
+    """
+    Euclidean distances between every detected face (M x D) and every known face (N x D).
+    Uses |a|^2 + |b|^2 - 2ab so the whole frame is one matrix product instead of a Python loop.
+    A float32 gallery (e.g. memory-mapped) is used as-is rather than copied to float64.
+    """
+    known = np.asarray(known_encodings)
+    if known.dtype != np.float32:
+        known = known.astype(np.float64, copy=False)
+    faces = np.asarray(face_encodings, dtype=known.dtype)
+    if faces.size == 0 or known.size == 0:
+        return np.empty((len(faces), len(known)), dtype=np.float64)
+
+    faces = faces.reshape(len(faces), -1)
+    known = known.reshape(len(known), -1)
+
+    squared = (
+        np.einsum("ij,ij->i", faces, faces)[:, None]
+        + np.einsum("ij,ij->i", known, known)[None, :]
+        - 2.0 * (faces @ known.T)
+    )
+    # Rounding can push tiny distances slightly below zero
+    np.maximum(squared, 0.0, out=squared)
+    return np.sqrt(squared, out=squared)
+
+
+def assign_matches(distances, tolerance=DEFAULT_TOLERANCE):
+    """
+    Assigns each face (row) to its closest known face (column) under tolerance.
+    Conflicts are resolved greedily by ascending distance, so two faces are never
+    given the same student. tolerance may also be one threshold per known face.
+    Returns (indices, distances) with -1 / inf for no match.
+    """
+    distances = np.asarray(distances, dtype=np.float64)
+    tolerance = np.asarray(tolerance, dtype=np.float64)
+    if tolerance.ndim:
+        # Per-student thresholds: rule out every pair above its student's threshold up front,
+        # after which the nearest-candidate logic below holds as for a single threshold
+        distances = np.where(distances <= tolerance[None, :], distances, np.inf)
+        tolerance = np.finfo(np.float64).max
+    n_faces, n_known = distances.shape
+    indices = np.full(n_faces, -1, dtype=np.int64)
+    matched = np.full(n_faces, np.inf, dtype=np.float64)
+    if n_faces == 0 or n_known == 0:
+        return indices, matched
+
+    if n_faces == 1:
+        best = int(np.argmin(distances[0]))
+        if distances[0, best] <= tolerance:
+            indices[0] = best
+            matched[0] = distances[0, best]
+        return indices, matched
+
+    # With M faces at most M-1 of them can take a face's preferred student,
+    # so the M nearest columns per row are enough candidates.
+    k = min(n_faces, n_known)
+    if k < n_known:
+        candidates = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.broadcast_to(np.arange(n_known), (n_faces, n_known))
+
+    rows = np.repeat(np.arange(n_faces), k)
+    cols = candidates.reshape(-1)
+    pair_distances = distances[rows, cols]
+    keep = pair_distances <= tolerance
+    rows, cols, pair_distances = rows[keep], cols[keep], pair_distances[keep]
+
+    taken = set()
+    for pos in np.argsort(pair_distances, kind="stable"):
+        row, col = rows[pos], cols[pos]
+        if indices[row] != -1 or col in taken:
+            continue
+        indices[row] = col
+        matched[row] = pair_distances[pos]
+        taken.add(col)
+
+    return indices, matched
+
+
+def effective_tolerance(tolerance, thresholds=None):
+    """Combines the session tolerance with per-student thresholds (NaN = use the tolerance)."""
+    if thresholds is None:
+        return tolerance
+    return np.where(np.isnan(thresholds), tolerance, thresholds)
+
+
+def refine_with_references(distances, face_encodings, references, reference_owners, tolerance,
+                           margin=REFERENCE_MARGIN):
+    """
+    Second stage for faces that narrowly missed a student's centroid: their distance
+    becomes the distance to the closest of that student's reference encodings.
+    reference_owners gives the gallery column of each reference row and must be
+    grouped (all references of a student next to each other).
+    Only faces with a near-threshold pair are compared against the references.
+    """
+    if references is None or len(references) == 0 or distances.size == 0:
+        return distances
+
+    tolerance = np.broadcast_to(np.asarray(tolerance, dtype=np.float64), (distances.shape[1],))
+    near = (distances > tolerance[None, :]) & (distances <= tolerance[None, :] + margin)
+    rows = np.flatnonzero(near.any(axis=1))
+    if rows.size == 0:
+        return distances
+
+    faces = np.asarray(face_encodings, dtype=np.float64).reshape(distances.shape[0], -1)[rows]
+    reference_distances = distance_matrix(faces, references)
+    owners = np.asarray(reference_owners)
+    starts = np.flatnonzero(np.r_[True, owners[1:] != owners[:-1]])
+    per_student = np.full((len(rows), distances.shape[1]), np.inf)
+    per_student[:, owners[starts]] = np.minimum.reduceat(reference_distances, starts, axis=1)
+
+    refined = np.array(distances, dtype=np.float64)
+    refined[rows] = np.where(near[rows], np.minimum(refined[rows], per_student), refined[rows])
+    return refined
+
+
+def match_faces(face_encodings, known_encodings, tolerance=DEFAULT_TOLERANCE, thresholds=None,
+                references=None, reference_owners=None):
+    """
+    Matches all faces in a frame against a gallery in one vectorized pass.
+    known_encodings holds one (centroid) encoding per student; references, if given,
+    are only consulted for near-threshold faces (see refine_with_references).
+    """
+    tolerance = effective_tolerance(tolerance, thresholds)
+    distances = distance_matrix(face_encodings, known_encodings)
+    distances = refine_with_references(distances, face_encodings, references, reference_owners, tolerance)
+    return assign_matches(distances, tolerance)
+
+
+def select_references(encodings, limit=MAX_REFERENCE_ENCODINGS):
+    """
+    Picks at most `limit` encodings of one student by farthest-point selection,
+    starting from the most typical one, so the kept set covers the widest range
+    of angles and lighting. Returns (references, centroid).
+    """
+    encodings = np.asarray(encodings, dtype=np.float64).reshape(len(encodings), -1)
+    centroid = encodings.mean(axis=0)
+    if len(encodings) <= limit:
+        return encodings, centroid
+
+    chosen = [int(np.argmin(distance_matrix(centroid[None, :], encodings)[0]))]
+    closest = distance_matrix(encodings[chosen], encodings)[0]
+    while len(chosen) < limit:
+        farthest = int(np.argmax(closest))
+        chosen.append(farthest)
+        closest = np.minimum(closest, distance_matrix(encodings[farthest][None, :], encodings)[0])
+    references = encodings[chosen]
+    return references, references.mean(axis=0)
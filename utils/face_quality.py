@@ -0,0 +1,71 @@
+import math
+import cv2
+import numpy as np
+
+# Crops are resized to this before the blur check so one threshold works for near and far faces
+SHARPNESS_SIZE = (64, 64)
+# Depth of the nose tip in front of the eyes, as a fraction of the distance between the eyes
+NOSE_DEPTH = 0.6
+
+
+def face_size(box):
+    """Shorter side of a (top, right, bottom, left) box in pixels."""
+    top, right, bottom, left = box
+    return min(bottom - top, right - left)
+
+
+def sharpness(gray_frame, box):
+    """Variance of the Laplacian over the face crop; low values mean a blurred face."""
+    top, right, bottom, left = box
+    crop = gray_frame[max(0, top):bottom, max(0, left):right]
+    if crop.size == 0:
+        return 0.0
+    crop = cv2.resize(crop, SHARPNESS_SIZE, interpolation=cv2.INTER_AREA)
+    return float(cv2.Laplacian(crop, cv2.CV_64F).var())
+
+
+def estimate_yaw(landmarks):
+    """
+    Rough head yaw in degrees from the eye and nose landmarks of face_recognition.
+    0 is frontal; the sign only says which way the head is turned.
+    Returns None if the landmarks needed are missing.
+    """
+    try:
+        left_eye = np.mean(landmarks["left_eye"], axis=0)
+        right_eye = np.mean(landmarks["right_eye"], axis=0)
+        nose = np.mean(landmarks["nose_tip"], axis=0)
+    except (KeyError, ValueError):
+        return None
+    eye_distance = np.linalg.norm(right_eye - left_eye)
+    if eye_distance == 0:
+        return None
+    # The nose tip moves sideways by depth*sin(yaw) while the eyes shrink to distance*cos(yaw)
+    offset = (nose[0] - (left_eye[0] + right_eye[0]) / 2) / eye_distance
+    return math.degrees(math.atan(offset / NOSE_DEPTH))
+
+
+def filter_faces(rgb_frame, face_locations, min_face_size=0, min_sharpness=0.0, max_yaw=0.0,
+                 landmarks_fn=None):
+    """
+    Returns the indices of face_locations worth encoding. A check is disabled when its
+    limit is 0. Checks run cheapest first (size, blur, pose) and each only looks at the
+    faces that passed the previous one. landmarks_fn(rgb_frame, boxes) must return one
+    landmark dict per box and is only needed when max_yaw is set.
+    """
+    keep = list(range(len(face_locations)))
+    if min_face_size:
+        keep = [i for i in keep if face_size(face_locations[i]) >= min_face_size]
+
+    if min_sharpness and keep:
+        gray = cv2.cvtColor(rgb_frame, cv2.COLOR_RGB2GRAY)
+        keep = [i for i in keep if sharpness(gray, face_locations[i]) >= min_sharpness]
+
+    if max_yaw and keep and landmarks_fn is not None:
+        landmarks = landmarks_fn(rgb_frame, [face_locations[i] for i in keep])
+        kept = []
+        for i, marks in zip(keep, landmarks):
+            yaw = estimate_yaw(marks)
+            if yaw is None or abs(yaw) <= max_yaw:
+                kept.append(i)
+        keep = kept
+    return keep
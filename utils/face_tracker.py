@@ -0,0 +1,116 @@
+import numpy as np
+
+
+def box_iou(boxes_a, boxes_b):
+    """IoU matrix between two lists of (top, right, bottom, left) boxes."""
+    a = np.asarray(boxes_a, dtype=np.float64).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float64).reshape(-1, 4)
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)))
+
+    top = np.maximum(a[:, None, 0], b[None, :, 0])
+    right = np.minimum(a[:, None, 1], b[None, :, 1])
+    bottom = np.minimum(a[:, None, 2], b[None, :, 2])
+    left = np.maximum(a[:, None, 3], b[None, :, 3])
+    intersection = np.clip(bottom - top, 0, None) * np.clip(right - left, 0, None)
+
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 1] - a[:, 3])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 1] - b[:, 3])
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return np.where(union > 0, intersection / np.maximum(union, 1e-9), 0.0)
+
+
+class Track:
+    def __init__(self, track_id, box):
+        self.track_id = track_id
+        self.box = box
+        self.student_id = None
+        self.name = None
+        self.distance = None
+        self.confidence = 0.0
+        self.misses = 0
+        self.hits = 0
+
+
+class FaceTracker:
+    """
+    Associates face boxes across consecutive frames of one recognition session so
+    a face whose identity is already confirmed does not need a new 128-d encoding.
+
+    Every frame a track is seen its confidence decays; once it drops below
+    min_confidence the face is encoded and matched again. Unknown faces start
+    with a lower confidence so they are retried more often than known ones.
+    """
+
+    def __init__(self, iou_threshold=0.3, decay=0.95, min_confidence=0.5,
+                 unknown_confidence=0.6, max_misses=5):
+        self.iou_threshold = iou_threshold
+        self.decay = decay
+        self.min_confidence = min_confidence
+        self.unknown_confidence = unknown_confidence
+        self.max_misses = max_misses
+        self.tracks = []
+        self._next_id = 1
+
+    def associate(self, boxes):
+        """
+        Matches this frame's boxes to existing tracks (greedy by IoU).
+        Returns one Track per box; boxes without a match get a fresh, unidentified track.
+        """
+        iou = box_iou([t.box for t in self.tracks], boxes)
+        assigned = [None] * len(boxes)
+        used_tracks = set()
+
+        if iou.size:
+            order = np.argsort(-iou, axis=None, kind="stable")
+            for flat in order:
+                t_idx, b_idx = np.unravel_index(flat, iou.shape)
+                if iou[t_idx, b_idx] < self.iou_threshold:
+                    break
+                if t_idx in used_tracks or assigned[b_idx] is not None:
+                    continue
+                track = self.tracks[t_idx]
+                track.box = boxes[b_idx]
+                track.confidence *= self.decay
+                track.misses = 0
+                track.hits += 1
+                assigned[b_idx] = track
+                used_tracks.add(t_idx)
+
+        # Age out tracks that left the frame
+        for t_idx, track in enumerate(self.tracks):
+            if t_idx not in used_tracks:
+                track.misses += 1
+        self.tracks = [t for t in self.tracks if t.misses <= self.max_misses]
+
+        for b_idx, track in enumerate(assigned):
+            if track is None:
+                track = Track(self._next_id, boxes[b_idx])
+                self._next_id += 1
+                self.tracks.append(track)
+                assigned[b_idx] = track
+
+        return assigned
+
+    def needs_encoding(self, track):
+        return track.confidence < self.min_confidence
+
+    def update_identity(self, track, student_id, name, distance):
+        """Stores the result of a fresh encoding + match for a track."""
+        if student_id is not None:
+            # A fresh match wins over an older track still holding the same student
+            for other in self.tracks:
+                if other is not track and other.student_id == student_id:
+                    other.student_id = None
+                    other.name = None
+                    other.distance = None
+                    other.confidence = 0.0
+            track.confidence = 1.0
+        else:
+            track.confidence = self.unknown_confidence
+        track.student_id = student_id
+        track.name = name
+        track.distance = distance
+
+    def reset(self):
+        self.tracks = []
@@ -0,0 +1,109 @@
+import os
+import threading
+import time
+from collections import deque
+import cv2
+
+
+def open_source(source):
+    """Opens a camera by device index ("0"), a stream URL (rtsp://, http://) or a video file."""
+    if isinstance(source, int) or str(source).isdigit():
+        return cv2.VideoCapture(int(source))
+    return cv2.VideoCapture(source)
+
+
+class FrameGrabber:
+    """
+    Reads frames from a capture source on a background thread.
+
+    Only the newest `buffer_size` frames are kept, so a slow consumer always gets a
+    recent frame instead of falling further behind, and slow decoding never blocks
+    recognition. Streams that drop are reopened after reconnect_delay seconds.
+    Video files are paced at their own frame rate so they behave like a camera.
+    """
+
+    def __init__(self, source, buffer_size=1, reconnect_delay=2.0):
+        self.source = source
+        self.reconnect_delay = reconnect_delay
+        self.is_file = isinstance(source, str) and os.path.isfile(source)
+        self.frames_read = 0
+        self.frames_dropped = 0
+        self.finished = False
+        self._buffer = deque(maxlen=buffer_size)
+        self._next_id = 0
+        self._last_returned = -1
+        self._condition = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        capture = open_source(self.source)
+        frame_interval = 0.0
+        if self.is_file:
+            fps = capture.get(cv2.CAP_PROP_FPS)
+            frame_interval = 1.0 / fps if fps and fps > 0 else 0.0
+        next_due = time.monotonic()
+
+        while not self._stop.is_set():
+            ok, frame = capture.read()
+            if not ok:
+                if self.is_file:
+                    break
+                # Camera or stream dropped: reopen instead of ending the session
+                capture.release()
+                if self._stop.wait(self.reconnect_delay):
+                    break
+                capture = open_source(self.source)
+                continue
+
+            with self._condition:
+                # Count frames pushed out before the consumer ever saw them
+                if len(self._buffer) == self._buffer.maxlen and self._buffer[0][0] > self._last_returned:
+                    self.frames_dropped += 1
+                self._buffer.append((self._next_id, frame))
+                self._next_id += 1
+                self.frames_read += 1
+                self._condition.notify_all()
+
+            if frame_interval:
+                next_due += frame_interval
+                delay = next_due - time.monotonic()
+                if delay > 0:
+                    self._stop.wait(delay)
+
+        capture.release()
+        with self._condition:
+            self.finished = True
+            self._condition.notify_all()
+
+    def read(self, timeout=1.0):
+        """
+        Returns (frame_id, frame) for the newest frame not returned before, waiting up
+        to timeout seconds for one. Returns (None, None) on timeout or end of input.
+        """
+        with self._condition:
+            self._condition.wait_for(
+                lambda: (self._buffer and self._buffer[-1][0] > self._last_returned) or self.finished,
+                timeout)
+            if not self._buffer or self._buffer[-1][0] <= self._last_returned:
+                return None, None
+            frame_id, frame = self._buffer[-1]
+            self._last_returned = frame_id
+            return frame_id, frame
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def stats(self):
+        return {
+            "frames_read": self.frames_read,
+            "frames_dropped": self.frames_dropped,
+            "finished": self.finished
+        }
@@ -33,6 +33,21 @@ def get_last_hash(cursor):
         return row[0]
     return "0" * 64  # Genesis hash (64 zeros)
 
+def find_chain_break(cursor):
+    """
+    Returns the ID of the first attendance record whose links or hash do not verify,
+    or None if the whole chain is intact (same checks as verify_integrity).
+    """
+    cursor.execute("SELECT id, student_id, subject, date, status, hour, previous_hash, current_hash FROM attendance ORDER BY id ASC")
+    expected_previous_hash = "0" * 64
+    for record_id, student_id, subject, date, status, hour, previous_hash, current_hash in cursor.fetchall():
+        if previous_hash != expected_previous_hash:
+            return record_id
+        expected_previous_hash = calculate_hash(student_id, subject, date, status, hour, previous_hash)
+        if expected_previous_hash != current_hash:
+            return record_id
+    return None
+
 def recalculate_chain(cursor, start_id):
     """
     Recalculates the hash chain starting from a specific record ID.
@@ -0,0 +1,48 @@
+import sys
+import os
+import pickle
+
+# Add parent directory to path to import utils
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import get_connection
+from utils.encoding_format import MAGIC, pack_encoding, unpack_encoding
+
+def migrate_encodings(verbose=True):
+    """
+    Converts pickled face encodings to the binary FENC format.
+    Only rows without the FENC header are read, so this is a single cheap query
+    once the table has been converted. Rows that cannot be read are cleared, so the
+    student shows as not enrolled instead of breaking their class gallery.
+    Returns the number of converted rows.
+    """
+    conn = get_connection()
+    c = conn.cursor()
+
+    c.execute("""SELECT id, usn, face_encoding FROM students
+                 WHERE face_encoding IS NOT NULL AND substr(face_encoding, 1, 4) != ?""", (MAGIC,))
+    records = c.fetchall()
+
+    count = 0
+    for sid, usn, encoding_blob in records:
+        try:
+            # Legacy rows were written by this app with pickle.dumps(ndarray)
+            encoding = pickle.loads(encoding_blob)
+            packed = pack_encoding(encoding)
+            if unpack_encoding(packed).size != 128:
+                raise ValueError("not a 128-d face encoding")
+        except Exception:
+            print(f"Cleared unreadable face encoding for student ID {sid} ({usn}); the face must be captured again")
+            c.execute("UPDATE students SET face_encoding=NULL WHERE id=?", (sid,))
+            continue
+        c.execute("UPDATE students SET face_encoding=? WHERE id=?", (packed, sid))
+        count += 1
+
+    conn.commit()
+    conn.close()
+    if verbose or count:
+        print(f"Face encoding migration complete. Converted {count} records.")
+    return count
+
+if __name__ == "__main__":
+    migrate_encodings()
@@ -1,15 +1,15 @@
-import sqlite3
 import sys
 import os
 
 # Add parent directory to path to import utils
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from database import get_connection
 from utils.hashing import calculate_hash
 
 def migrate_hashes():
     print("Starting hash migration...")
-    conn = sqlite3.connect('attendance.db')
+    conn = get_connection()
     c = conn.cursor()
     
     # Fetch all records ordered by ID
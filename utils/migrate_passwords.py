@@ -1,8 +1,14 @@
-import sqlite3
 import datetime
+import os
+import sys
+
+# Add parent directory to path to import database
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import get_connection
 
 def migrate_passwords():
-    conn = sqlite3.connect('attendance.db')
+    conn = get_connection()
     c = conn.cursor()
     
     print("Migrating student passwords (DOB) to ddmmyyyy format...")
@@ -0,0 +1,67 @@
+import time
+import cv2
+import numpy as np
+
+# Thumbnail the frame is compared on; each cell covers roughly a 20x20 block of a 640x480 frame
+THUMBNAIL_SIZE = (32, 24)
+# Grey-level difference above which a thumbnail cell counts as changed
+CELL_THRESHOLD = 12
+
+
+class MotionGate:
+    """
+    Cheap change detector run before full recognition in a live session.
+
+    Frames are compared on a tiny grayscale thumbnail decoded straight from the
+    JPEG at 1/8 scale. When fewer than `threshold` (a fraction) of the cells
+    changed since the last processed frame, the frame can be skipped and the
+    previous results reused. A frame is always processed once refresh_interval
+    seconds have passed, so people who walk in slowly are still picked up.
+    """
+
+    def __init__(self, threshold=0.01, refresh_interval=2.0):
+        self.threshold = threshold
+        self.refresh_interval = refresh_interval
+        self.processed = 0
+        self.skipped = 0
+        self.forced = 0
+        self._reference = None
+        self._reference_time = 0.0
+
+    def should_process(self, buffer):
+        """
+        Returns True if this JPEG frame differs enough from the last processed one.
+        The frame becomes the new reference whenever True is returned.
+        """
+        small = cv2.imdecode(np.frombuffer(buffer, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+        if small is None:
+            # Let the recognition worker report the broken frame
+            return True
+        thumbnail = cv2.resize(small, THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA).astype(np.int16)
+        now = time.monotonic()
+
+        if self._reference is not None:
+            changed = np.count_nonzero(np.abs(thumbnail - self._reference) > CELL_THRESHOLD) / thumbnail.size
+            if changed < self.threshold:
+                if now - self._reference_time < self.refresh_interval:
+                    self.skipped += 1
+                    return False
+                self.forced += 1
+
+        self._reference = thumbnail
+        self._reference_time = now
+        self.processed += 1
+        return True
+
+    def reset(self):
+        """Forces the next frame through (e.g. after the roster changed or a frame failed)."""
+        self._reference = None
+
+    def stats(self):
+        return {
+            "threshold": self.threshold,
+            "refresh_interval": self.refresh_interval,
+            "processed": self.processed,
+            "skipped": self.skipped,
+            "forced_refreshes": self.forced
+        }
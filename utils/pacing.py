@@ -0,0 +1,32 @@
+# Fastest a client is asked to send frames; sampling a live camera faster adds little
+MIN_DELAY_MS = 100
+# Slowest, used when the recognition queue is full
+MAX_DELAY_MS = 2000
+# (load, JPEG quality, maximum frame width): the first row whose load is not exceeded applies.
+# load = recognition tasks queued or running per worker
+QUALITY_STEPS = [(1.0, 90, 640), (2.0, 75, 480), (float("inf"), 60, 320)]
+
+
+def pacing_hints(in_flight, workers, max_pending, latency_ms):
+    """
+    Tells a live client when to send its next frame and how large to make it.
+
+    While there is less than one task per worker, clients send at MIN_DELAY_MS with
+    up to two frames in flight. Above that the delay grows with the recent latency
+    times the load, only one frame may be in flight, and frames get smaller.
+    """
+    load = in_flight / max(1, workers)
+    if in_flight >= max_pending:
+        delay = MAX_DELAY_MS
+    elif load < 1:
+        delay = MIN_DELAY_MS
+    else:
+        delay = (latency_ms or 0) * load
+    quality, width = next((quality, width) for limit, quality, width in QUALITY_STEPS if load <= limit)
+    return {
+        "next_delay_ms": int(min(MAX_DELAY_MS, max(MIN_DELAY_MS, delay))),
+        "jpeg_quality": quality,
+        "max_width": width,
+        "max_in_flight": 2 if load < 1 else 1,
+        "load": round(load, 2)
+    }
@@ -0,0 +1,50 @@
+import numpy as np
+
+
+def tile_grid(height, width, tile_size=1024, overlap=192):
+    """
+    Splits an image into tiles of at most tile_size pixels that overlap by `overlap`
+    pixels, so a face cut by one tile border lies whole inside the neighbouring tile.
+    Returns (top, left, bottom, right) tuples covering the whole image.
+    """
+    step = max(1, tile_size - overlap)
+
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        positions = list(range(0, length - tile_size, step))
+        # The last tile is aligned with the image edge instead of running past it
+        return positions + [length - tile_size]
+
+    return [(top, left, min(top + tile_size, height), min(left + tile_size, width))
+            for top in starts(height) for left in starts(width)]
+
+
+def merge_boxes(boxes, overlap_threshold=0.5):
+    """
+    Drops duplicate (top, right, bottom, left) boxes found by neighbouring tiles.
+    Two boxes are duplicates when their intersection covers overlap_threshold of the
+    smaller one; the larger box is kept because a face cut by a tile border only
+    yields a partial box. Returns the indices of the boxes kept.
+    """
+    if len(boxes) == 0:
+        return []
+    b = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    areas = (b[:, 2] - b[:, 0]) * (b[:, 1] - b[:, 3])
+
+    top = np.maximum(b[:, None, 0], b[None, :, 0])
+    right = np.minimum(b[:, None, 1], b[None, :, 1])
+    bottom = np.minimum(b[:, None, 2], b[None, :, 2])
+    left = np.maximum(b[:, None, 3], b[None, :, 3])
+    intersection = np.clip(bottom - top, 0, None) * np.clip(right - left, 0, None)
+    smaller = np.maximum(np.minimum(areas[:, None], areas[None, :]), 1e-9)
+    duplicate = intersection / smaller >= overlap_threshold
+
+    keep = []
+    suppressed = np.zeros(len(b), dtype=bool)
+    for i in np.argsort(-areas, kind="stable"):
+        if suppressed[i]:
+            continue
+        keep.append(int(i))
+        suppressed |= duplicate[i]
+    return sorted(keep)
@@ -0,0 +1,85 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+import numpy as np
+
+# Upper bounds (milliseconds) of the histogram buckets; a last bucket catches anything slower
+HISTOGRAM_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+# Samples kept per class and stage; older ones roll off
+TIMING_WINDOW = 1000
+
+
+class StageTimer:
+    """Accumulates wall time per named stage of one request."""
+
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def update(self, stages):
+        for name, seconds in stages.items():
+            self.add(name, seconds)
+
+    def server_timing(self):
+        """Value for the Server-Timing response header (durations in milliseconds)."""
+        return ", ".join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.stages.items())
+
+
+def summarize(samples_ms, buckets=HISTOGRAM_BUCKETS_MS):
+    """
+    Percentiles and bucket counts for a list of millisecond samples.
+    counts[i] is the number of samples up to buckets_ms[i]; the extra last count is the overflow.
+    """
+    ms = np.asarray(samples_ms)
+    counts, _ = np.histogram(ms, bins=[0] + list(buckets) + [np.inf])
+    return {
+        "count": len(ms),
+        "mean": round(float(ms.mean()), 3),
+        "p50": round(float(np.percentile(ms, 50)), 3),
+        "p90": round(float(np.percentile(ms, 90)), 3),
+        "p99": round(float(np.percentile(ms, 99)), 3),
+        "max": round(float(ms.max()), 3),
+        "histogram": {"buckets_ms": list(buckets), "counts": counts.tolist()}
+    }
+
+
+class TimingHistograms:
+    """
+    Rolling per-key (class id) stage timings for capacity planning.
+    Only the last `window` samples of each stage are kept, so the numbers
+    describe current load rather than everything since startup.
+    """
+
+    def __init__(self, window=TIMING_WINDOW, buckets=HISTOGRAM_BUCKETS_MS):
+        self.window = window
+        self.buckets = buckets
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, key, stages):
+        """Adds one request's {stage: seconds} to the window of `key`."""
+        with self._lock:
+            per_stage = self._samples.setdefault(key, {})
+            for name, seconds in stages.items():
+                window = per_stage.get(name)
+                if window is None:
+                    window = per_stage[name] = deque(maxlen=self.window)
+                window.append(seconds * 1000)
+
+    def stats(self):
+        with self._lock:
+            snapshot = {key: {name: list(window) for name, window in per_stage.items()}
+                        for key, per_stage in self._samples.items()}
+        return {str(key): {name: summarize(samples, self.buckets) for name, samples in per_stage.items()}
+                for key, per_stage in snapshot.items()}
@@ -1,4 +1,3 @@
-import sqlite3
 import sys
 import os
 import json
@@ -6,10 +5,11 @@ import json
 # Add parent directory to path if running from root
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
+from database import get_connection
 from utils.hashing import calculate_hash
 
 def verify_chain():
-    conn = sqlite3.connect('attendance.db')
+    conn = get_connection()
     c = conn.cursor()
     
     c.execute("SELECT id, student_id, subject, date, status, hour, previous_hash, current_hash FROM attendance ORDER BY id ASC")
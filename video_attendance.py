@@ -0,0 +1,323 @@
+import datetime
+import json
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import cv2
+from face_recog import get_class_gallery, get_class_detection_settings, process_frame
+from utils.attendance_writer import write_attendance
+from utils.face_matching import DEFAULT_TOLERANCE
+from utils.face_tracker import FaceTracker
+from database import get_connection
+
+UPLOAD_DIR = "video_uploads"
+VIDEO_EXTENSIONS = {".mp4", ".avi", ".mkv", ".mov", ".webm"}
+# Length of one unit of work; chunks run in parallel and are the unit of progress/resume
+CHUNK_SECONDS = 120
+DEFAULT_SAMPLE_FPS = 1.0
+# A student counts as present after being recognized in this many sampled frames
+DEFAULT_MIN_FRAMES = 3
+VIDEO_WORKERS = int(os.environ.get("VIDEO_WORKERS", os.cpu_count() or 1))
+# The process running a job refreshes heartbeat_at this often (seconds); a job whose
+# heartbeat is older than JOB_HEARTBEAT_TIMEOUT has lost its owner
+JOB_HEARTBEAT_INTERVAL = 15
+JOB_HEARTBEAT_TIMEOUT = 60
+
+_active_jobs = set()
+_active_lock = threading.Lock()
+
+
+def create_job(class_id, subject, hour, date, video_file, filename, sample_fps=DEFAULT_SAMPLE_FPS,
+               min_frames=DEFAULT_MIN_FRAMES):
+    """
+    Stores an uploaded recording under video_uploads/<job_id>/ and splits its
+    timeline into chunks of CHUNK_SECONDS. Raises ValueError if the file cannot
+    be read as a video. Returns the job id.
+    """
+    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("""INSERT INTO video_jobs (class_id, subject, hour, date, sample_fps, min_frames, status, created_at,
+                                         owner_pid, heartbeat_at)
+                 VALUES (?,?,?,?,?,?, 'pending', ?,?,?)""",
+              (class_id, subject, str(hour), date, sample_fps, min_frames, timestamp, os.getpid(), time.time()))
+    job_id = c.lastrowid
+    job_dir = os.path.join(UPLOAD_DIR, str(job_id))
+    os.makedirs(job_dir, exist_ok=True)
+
+    # Only keep the base name so the upload cannot escape the job directory
+    video_path = os.path.join(job_dir, os.path.basename(filename))
+    with open(video_path, "wb") as dst:
+        shutil.copyfileobj(video_file, dst)
+
+    capture = cv2.VideoCapture(video_path)
+    fps = capture.get(cv2.CAP_PROP_FPS)
+    frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    readable = capture.isOpened() and capture.grab()
+    capture.release()
+    if not readable or not fps or fps <= 0:
+        conn.rollback()
+        conn.close()
+        shutil.rmtree(job_dir, ignore_errors=True)
+        raise ValueError("Could not read the video file")
+
+    # Some containers do not report a frame count; then one chunk reads to the end
+    chunk_frames = max(1, int(fps * CHUNK_SECONDS))
+    if frame_count > 0:
+        chunks = [(job_id, start, min(start + chunk_frames, frame_count), "pending")
+                  for start in range(0, frame_count, chunk_frames)]
+    else:
+        chunks = [(job_id, 0, None, "pending")]
+    c.executemany("INSERT INTO video_chunks (job_id, start_frame, end_frame, status) VALUES (?,?,?,?)", chunks)
+    c.execute("UPDATE video_jobs SET video_path=?, fps=?, total=? WHERE id=?", (video_path, fps, len(chunks), job_id))
+    conn.commit()
+    conn.close()
+    return job_id
+
+
+def process_chunk(video_path, class_id, start_frame, end_frame, fps, sample_fps, tolerance=DEFAULT_TOLERANCE):
+    """
+    Worker entry point: recognizes every sampled frame of one chunk.
+    Frames between samples are only grabbed, not decoded into images.
+    Returns {"sampled": n, "sightings": {student_id: {frames, best_distance, first_seen, last_seen}}}
+    with times in seconds from the start of the recording.
+    """
+    gallery = get_class_gallery(class_id)
+    detection = get_class_detection_settings(class_id)
+    tracker = FaceTracker()
+    step = max(1, int(round(fps / sample_fps)))
+
+    capture = cv2.VideoCapture(video_path)
+    capture.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+    sightings = {}
+    sampled = 0
+    frame_no = start_frame
+    while end_frame is None or frame_no < end_frame:
+        if (frame_no - start_frame) % step:
+            if not capture.grab():
+                break
+            frame_no += 1
+            continue
+
+        ok, frame = capture.read()
+        if not ok:
+            break
+        results = process_frame(frame, gallery.encodings, gallery.student_ids, gallery.student_names, tolerance,
+                                detection=detection, tracker=tracker, thresholds=gallery.thresholds,
+                                references=gallery.references, reference_owners=gallery.reference_owners)
+        sampled += 1
+        seconds = round(frame_no / fps, 2)
+        for result in results:
+            if result["student_id"] is None:
+                continue
+            seen = sightings.setdefault(str(result["student_id"]), {
+                "frames": 0, "best_distance": result["distance"], "first_seen": seconds, "last_seen": seconds})
+            seen["frames"] += 1
+            seen["last_seen"] = seconds
+            if result["distance"] is not None and (seen["best_distance"] is None
+                                                   or result["distance"] < seen["best_distance"]):
+                seen["best_distance"] = result["distance"]
+        frame_no += 1
+
+    capture.release()
+    return {"sampled": sampled, "sightings": sightings}
+
+
+def merge_sightings(chunk_results):
+    """Combines per-chunk sightings into one entry per student."""
+    merged = {}
+    for result in chunk_results:
+        for student_id, seen in result["sightings"].items():
+            total = merged.get(int(student_id))
+            if total is None:
+                merged[int(student_id)] = dict(seen)
+                continue
+            total["frames"] += seen["frames"]
+            total["first_seen"] = min(total["first_seen"], seen["first_seen"])
+            total["last_seen"] = max(total["last_seen"], seen["last_seen"])
+            if seen["best_distance"] is not None and (total["best_distance"] is None
+                                                      or seen["best_distance"] < total["best_distance"]):
+                total["best_distance"] = seen["best_distance"]
+    return merged
+
+
+def start_job(job_id):
+    """
+    Runs a job in a background thread. Finished chunks are kept, so a job resumed
+    after an interruption only processes the chunks still pending.
+    Returns False if the job is already running in this process.
+    """
+    with _active_lock:
+        if job_id in _active_jobs:
+            return False
+        _active_jobs.add(job_id)
+    threading.Thread(target=_run_job, args=(job_id,), daemon=True).start()
+    return True
+
+
+def resume_job(job_id):
+    """
+    Restarts an interrupted job, or one whose owning process is gone. Completed jobs are
+    refused: their recording has been deleted and their attendance already written.
+    The job is claimed atomically, so only one process resumes it. Returns False if the
+    job cannot resume.
+    """
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("SELECT status, owner_pid, heartbeat_at FROM video_jobs WHERE id=?", (job_id,))
+    row = c.fetchone()
+    if not row or not (row[0] == "interrupted" or (row[0] in ("pending", "running") and not _owner_alive(row[1], row[2]))):
+        conn.close()
+        return False
+    # Claim only if nobody changed the job since it was read
+    c.execute("""UPDATE video_jobs SET status='pending', owner_pid=?, heartbeat_at=?
+                 WHERE id=? AND status=? AND owner_pid IS ? AND heartbeat_at IS ?""",
+              (os.getpid(), time.time(), job_id, *row))
+    claimed = c.rowcount == 1
+    conn.commit()
+    conn.close()
+    return claimed and start_job(job_id)
+
+
+def mark_orphaned_jobs():
+    """
+    Marks jobs left pending or running by a process that is gone as interrupted, so they
+    can be resumed. Jobs of other live processes (e.g. sibling web workers) are left alone.
+    Call once at startup, before any job is started.
+    """
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("SELECT id, owner_pid, heartbeat_at FROM video_jobs WHERE status IN ('pending', 'running')")
+    # A job already owned by this pid belonged to an earlier server (pids are reused,
+    # e.g. pid 1 in a container): this process has not started any job yet
+    orphaned = [(job_id,) for job_id, owner_pid, heartbeat_at in c.fetchall()
+                if owner_pid == os.getpid() or not _owner_alive(owner_pid, heartbeat_at)]
+    c.executemany("""UPDATE video_jobs SET status='interrupted', message='Server restarted while processing'
+                     WHERE id=? AND status IN ('pending', 'running')""", orphaned)
+    conn.commit()
+    conn.close()
+
+
+def _owner_alive(owner_pid, heartbeat_at):
+    """Whether the process that owns a job still runs it (jobs from before ownership have none)."""
+    if owner_pid is None or heartbeat_at is None or time.time() - heartbeat_at > JOB_HEARTBEAT_TIMEOUT:
+        return False
+    if os.name == "nt":
+        # os.kill(pid, 0) terminates the process on Windows; rely on the heartbeat there
+        return True
+    try:
+        os.kill(owner_pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Exists, but belongs to another user
+        return True
+    return True
+
+
+def _heartbeat(job_id, stop):
+    # Own connection: the job's connection is busy in the job thread
+    conn = get_connection()
+    try:
+        while not stop.wait(JOB_HEARTBEAT_INTERVAL):
+            conn.execute("UPDATE video_jobs SET heartbeat_at=? WHERE id=? AND owner_pid=?",
+                         (time.time(), job_id, os.getpid()))
+            conn.commit()
+    finally:
+        conn.close()
+
+
+def _run_job(job_id):
+    conn = get_connection()
+    c = conn.cursor()
+    stop_heartbeat = threading.Event()
+    try:
+        c.execute("""SELECT class_id, subject, hour, date, video_path, fps, sample_fps, min_frames
+                     FROM video_jobs WHERE id=?""", (job_id,))
+        class_id, subject, hour, date, video_path, fps, sample_fps, min_frames = c.fetchone()
+        c.execute("UPDATE video_jobs SET status='running', message=NULL, owner_pid=?, heartbeat_at=? WHERE id=?",
+                  (os.getpid(), time.time(), job_id))
+        conn.commit()
+        threading.Thread(target=_heartbeat, args=(job_id, stop_heartbeat), daemon=True).start()
+
+        c.execute("SELECT id, start_frame, end_frame FROM video_chunks WHERE job_id=? AND status='pending' ORDER BY id",
+                  (job_id,))
+        pending = c.fetchall()
+
+        with ProcessPoolExecutor(max_workers=max(1, min(VIDEO_WORKERS, len(pending) or 1)),
+                                 mp_context=multiprocessing.get_context("spawn")) as executor:
+            futures = {executor.submit(process_chunk, video_path, class_id, start, end, fps, sample_fps): chunk_id
+                       for chunk_id, start, end in pending}
+            # Progress is recorded chunk by chunk as they finish, in any order
+            for future in as_completed(futures):
+                c.execute("UPDATE video_chunks SET status='done', result=? WHERE id=?",
+                          (json.dumps(future.result()), futures[future]))
+                c.execute("UPDATE video_jobs SET processed = processed + 1 WHERE id=?", (job_id,))
+                conn.commit()
+
+        c.execute("SELECT result FROM video_chunks WHERE job_id=? AND status='done'", (job_id,))
+        merged = merge_sightings([json.loads(row[0]) for row in c.fetchall()])
+        present_ids = {sid for sid, seen in merged.items() if seen["frames"] >= min_frames}
+
+        write_attendance(c, class_id, subject, date, hour, present_ids)
+        c.execute("UPDATE video_jobs SET status='completed', present=? WHERE id=?", (len(present_ids), job_id))
+        conn.commit()
+        # The recording is no longer needed once attendance is written
+        shutil.rmtree(os.path.dirname(video_path), ignore_errors=True)
+    except Exception as e:
+        conn.rollback()
+        c.execute("UPDATE video_jobs SET status='interrupted', message=? WHERE id=?", (str(e), job_id))
+        conn.commit()
+    finally:
+        stop_heartbeat.set()
+        conn.close()
+        with _active_lock:
+            _active_jobs.discard(job_id)
+
+
+def job_status(job_id):
+    """Progress summary for the polling endpoint; per-student sightings once chunks are done."""
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute("""SELECT id, class_id, subject, hour, date, status, total, processed, present, min_frames,
+                        created_at, message, owner_pid, heartbeat_at
+                 FROM video_jobs WHERE id=?""", (job_id,))
+    job = c.fetchone()
+    if not job:
+        conn.close()
+        return None
+
+    c.execute("SELECT result FROM video_chunks WHERE job_id=? AND status='done'", (job_id,))
+    results = [json.loads(row[0]) for row in c.fetchall()]
+    merged = merge_sightings(results)
+    names = {}
+    if merged:
+        placeholders = ",".join("?" * len(merged))
+        c.execute(f"SELECT id, name FROM students WHERE id IN ({placeholders})", list(merged))
+        names = dict(c.fetchall())
+    conn.close()
+
+    sightings = [dict(seen, student_id=sid, name=names.get(sid), present=seen["frames"] >= job[9])
+                 for sid, seen in sorted(merged.items(), key=lambda item: -item[1]["frames"])]
+    return {
+        "id": job[0],
+        "class_id": job[1],
+        "subject": job[2],
+        "hour": job[3],
+        "date": job[4],
+        "status": job[5],
+        "total": job[6],
+        "processed": job[7],
+        "present": job[8],
+        "min_frames": job[9],
+        "created_at": job[10],
+        "message": job[11],
+        "frames_sampled": sum(r["sampled"] for r in results),
+        "sightings": sightings,
+        # Also true while another server process runs the job
+        "running": job_id in _active_jobs or (job[5] in ("pending", "running") and _owner_alive(job[12], job[13]))
+    }